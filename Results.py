@@ -1,222 +1,614 @@
-import re
-import json
-
-from collections import defaultdict
-from urllib.parse import urlparse, urldefrag
-from datetime import datetime
-
-class Results:
-    def __init__(self):
-        """
-        Class to store the assignment results.
-        Stores:
-            A set of unique pages
-            The longest length of a page
-            A dictionary of words
-            A dictionary of subdomains
-        """
-        self.unique_pages = set()
-        self.longest_page_count = 0
-        self.longest_page = ""
-        self.words = defaultdict(int)
-        self.subdomains = defaultdict(int)
-        self.stopwords = ["a", "about", "above", "after", "again", "against", "all", "am", "an", "and", "any", "are",
-                          "aren't", "as", "at", "be", "because", "been", "before", "being", "below", "between", "both",
-                          "but", "by", "can't", "cannot", "could", "couldn't", "did", "didn't", "do", "does", "doesn't",
-                          "doing", "don't", "down", "during", "each", "few", "for", "from", "further", "had", "hadn't",
-                          "has", "hasn't", "have", "haven't", "having", "he", "he'd", "he'll", "he's", "her", "here",
-                          "here's", "hers", "herself", "him", "himself", "his", "how", "how's", "i", "i'd", "i'll",
-                          "i'm", "i've", "if", "in", "into", "is", "isn't", "it", "it's", "its", "itself", "let's",
-                          "me", "more", "most", "mustn't", "my", "myself", "no", "nor", "not", "of", "off", "on",
-                          "once", "only", "or", "other", "ought", "our", "ours	ourselves", "out", "over", "own",
-                          "same", "shan't", "she", "she'd", "she'll", "she's", "should", "shouldn't", "so", "some",
-                          "such", "than", "that", "that's", "the", "their", "theirs", "them", "themselves", "then",
-                          "there", "there's", "these", "they", "they'd", "they'll", "they're", "they've", "this",
-                          "those", "through", "to", "too", "under", "until", "up", "very", "was", "wasn't", "we",
-                          "we'd", "we'll", "we're", "we've", "were", "weren't", "what", "what's", "when", "when's",
-                          "where", "where's", "which", "while", "who", "who's", "whom", "why", "why's", "with", "won't",
-                          "would", "wouldn't", "you", "you'd", "you'll", "you're", "you've", "your", "yours",
-                          "yourself", "yourselves"]
-
-    def add_subdomain(self, url) -> None:
-        """
-        Adds a subdomain to the subdomain results.
-        If a given URL has a previously recorded subdomain, increments the
-        subdomain's counter.
-        :param url: the url with the subdomain of interest.
-        :return: None
-        """
-        subdomain_pattern = r'^(?:https?://)?((?:[a-zA-Z0-9-]+\.)*ics\.uci\.edu)(?:/|$)'
-        match = re.match(subdomain_pattern, url)
-        subdomain = match.group(1) if match else None
-
-        if subdomain:
-            if subdomain in self.subdomains:
-                self.subdomains[subdomain] += 1
-            else:
-                self.subdomains[subdomain] = 1
-
-    def add_unique_page(self, url) -> None:
-        """
-        Adds a url to the set of unique pages.
-        :param url: the url to add
-        :return: void
-        """
-        self.unique_pages.add(urldefrag(url).url)
-        self.add_subdomain(url)
-
-    def update_longest_length(self, count, url) -> None:
-        """
-        Updates the current longest page length, if the
-        passed length is greater.
-        :param count: the count of the current page
-        :return: void
-        """
-        if count > self.longest_page_count:
-            self.longest_page_count = count
-            self.longest_page = url
-
-    def add_word(self, new_word) -> None:
-        """
-        Adds the passed word to the word dict.
-        If the word is already in the dict, increment its counter.
-        :param new_word:
-        :return:
-        """
-        word = new_word.lower()
-        if word not in self.stopwords:
-            self.words[word] += 1
-        else:
-            pass
-
-    def get_words(self) -> list:
-        """
-        Sorts the dict by most frequent word first, then returns it.
-        :return: the sorted dictionary of words.
-        """
-        return self.words
-
-    def get_subdomains(self) -> dict:
-        """
-        Returns the list of subdomains.
-        :return: the dictionary of subdomains.
-        """
-        return self.subdomains
-
-    def print_subdomains(self) -> None:
-        """
-        Writes the subdomains to file.
-        """
-        sorted_dict = sorted(self.subdomains.items(), key=lambda x: x[1], reverse=True)
-
-        file = open("subdomainOutput.txt", 'w')
-
-        for subdomain, count in sorted_dict:
-            file.write(subdomain + " -> " + str(count) + "\n")
-
-        file.close()
-
-    def print_words(self) -> None:
-        """
-        Writes the words to file.
-        """
-        sorted_dict = sorted(self.words.items(), key=lambda x: x[1], reverse=True)
-
-        file = open("words.txt", 'w')
-
-        for word, count in sorted_dict:
-            file.write(word + " -> " + str(count) + "\n")
-
-        file.close()
-
-    def export_word_json(self):
-        """
-        Exports the results.words dictionary to json.
-        For stopping and continuing.
-        :return: None
-        """
-        with open("wordJSON.json", "w") as outfile:
-            json.dump(self.words, outfile)
-
-        outfile.close()
-
-    def import_word_json(self):
-        """
-        Imports the results.words dictionary from json.
-        For stopping and continuing.
-        :return: None
-        """
-        infile = open("wordJSON.json", "r")
-        self.words = json.load(infile)
-
-        infile.close()
-
-    def export_subdomain_json(self):
-        """
-        Exports the subdomains to json.
-        :return: None
-        """
-        with open("subdomainJSON.json", "w") as outfile:
-            json.dump(self.subdomains, outfile)
-
-        outfile.close()
-
-    def import_subdomain_json(self):
-        """
-        Imports the subdomains from json.
-        :return: None
-        """
-        infile = open("subdomainJSON.json", "r")
-        self.subdomains = json.load(infile)
-
-        infile.close()
-
-    def export_log(self):
-        """
-        Updates the log file with crawl starts.
-        :return:
-        """
-        infile = open("log.txt", 'a')
-        infile.write(str(self.longest_page_count) + " " + str(datetime.now()) + "\n")
-
-        infile.close()
-
-    def export_longest_count(self):
-        """
-        Records the longest page count found.
-        :return: None.
-        """
-        outfile = open("longest_count.txt", 'w')
-        outfile.write(str(self.longest_page_count))
-
-        outfile.close()
-
-    def import_longest_count(self):
-        """
-        Loads the longest page count found.
-        :return:
-        """
-        infile = open("longest_count.txt", 'r')
-        self.longest_page_count = int(infile.readline())
-
-        infile.close()
-
-    def export_longest_page(self):
-        """
-        Records the longest page found
-        :return: None.
-        """
-        outfile = open("longest_page.txt", 'w')
-        outfile.write(self.longest_page + "\n")
-
-        outfile.close()
-
-    def import_longest_page(self):
-        """
-        Loads the longest file found
-        :return:
-        """
-        infile = open("longest_page.txt", 'r')
-        self.longest_page = infile.readline()
-
-        infile.close()
\ No newline at end of file
+import os
+import re
+import heapq
+import json
+import signal
+import tempfile
+import threading
+import time
+import weakref
+
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+from itertools import islice
+from datetime import datetime
+from operator import itemgetter
+
+from utils.metrics import METRICS
+from utils.word_counts import WordCounter
+
+# Words left out of the word counts.
+STOPWORDS = frozenset([
+    "a", "about", "above", "after", "again", "against", "all", "am", "an", "and", "any", "are", "aren't", "as",
+    "at", "be", "because", "been", "before", "being", "below", "between", "both", "but", "by", "can't", "cannot",
+    "could", "couldn't", "did", "didn't", "do", "does", "doesn't", "doing", "don't", "down", "during", "each",
+    "few", "for", "from", "further", "had", "hadn't", "has", "hasn't", "have", "haven't", "having", "he", "he'd",
+    "he'll", "he's", "her", "here", "here's", "hers", "herself", "him", "himself", "his", "how", "how's", "i",
+    "i'd", "i'll", "i'm", "i've", "if", "in", "into", "is", "isn't", "it", "it's", "its", "itself", "let's", "me",
+    "more", "most", "mustn't", "my", "myself", "no", "nor", "not", "of", "off", "on", "once", "only", "or", "other",
+    "ought", "our", "ours", "ourselves", "out", "over", "own", "same", "shan't", "she", "she'd", "she'll", "she's",
+    "should", "shouldn't", "so", "some", "such", "than", "that", "that's", "the", "their", "theirs", "them",
+    "themselves", "then", "there", "there's", "these", "they", "they'd", "they'll", "they're", "they've", "this",
+    "those", "through", "to", "too", "under", "until", "up", "very", "was", "wasn't", "we", "we'd", "we'll",
+    "we're", "we've", "were", "weren't", "what", "what's", "when", "when's", "where", "where's", "which", "while",
+    "who", "who's", "whom", "why", "why's", "with", "won't", "would", "wouldn't", "you", "you'd", "you'll",
+    "you're", "you've", "your", "yours", "yourself", "yourselves"
+])
+
+# Words added at once, under the lock, when merging a stream of word counts.
+MERGE_BATCH = 100000
+
+# Every live Results object, so that they can all be checkpointed on shutdown.
+_LIVE_RESULTS = weakref.WeakSet()
+# Signals received while the main thread was checkpointing, handled once the
+# checkpoint is done.
+_DEFERRED_SIGNALS = list()
+
+
+def atomic_write(path, write):
+    """
+    Writes a file through a temporary file and a rename, so that readers
+    never see a partially written file.
+    :param path: the file to write.
+    :param write: a function taking the open temporary file.
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as outfile:
+            write(outfile)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def top_counts(counts, top=0) -> list:
+    """
+    Gets the most frequent entries of a dict of counts, most frequent first.
+    Finds the top entries in O(n log top) with a heap instead of sorting
+    everything.
+    :param counts: a dict of key -> count.
+    :param top: how many entries to get, 0 for all of them.
+    :return: a list of (key, count) tuples.
+    """
+    # Copy first, workers may be adding counts while the report is written.
+    items = list(dict(counts).items())
+    if top <= 0 or top >= len(items):
+        return sorted(items, key=itemgetter(1), reverse=True)
+    return heapq.nlargest(top, items, key=itemgetter(1))
+
+
+SUBDOMAIN_PATTERN = re.compile(r'^(?:https?://)?((?:[a-zA-Z0-9-]+\.)*ics\.uci\.edu)(?:/|$)')
+
+
+def subdomain_of(url):
+    """
+    :param url: a url.
+    :return: its ics.uci.edu subdomain, or None if it is not in one.
+    """
+    match = SUBDOMAIN_PATTERN.match(url)
+    return match.group(1) if match else None
+
+
+def checkpoint_all() -> None:
+    """
+    Checkpoints every live Results object and writes its reports.
+    :return: None
+    """
+    for results in list(_LIVE_RESULTS):
+        results.checkpoint()
+        results.write_reports()
+
+
+def _stop(signum) -> None:
+    """
+    Checkpoints all results and stops the process for a signal.
+    :param signum: SIGINT or SIGTERM.
+    :return: None
+    """
+    checkpoint_all()
+    if signum == signal.SIGINT:
+        raise KeyboardInterrupt
+    raise SystemExit(128 + signum)
+
+
+def install_signal_handlers() -> None:
+    """
+    Checkpoints all results before the process is stopped by SIGINT or
+    SIGTERM. Only has an effect when called from the main thread. A signal
+    received while the main thread is checkpointing stops the process once
+    that checkpoint is done, instead of cutting it short.
+    :return: None
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def handler(signum, frame):
+        if any(results.checkpoint_thread == threading.get_ident()
+               for results in list(_LIVE_RESULTS)):
+            _DEFERRED_SIGNALS.append(signum)
+            return
+        _stop(signum)
+
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+
+class Results:
+    def __init__(self, checkpoint_interval=30.0, checkpoint_pages=100,
+                 report_top_words=50, report_top_subdomains=0,
+                 checkpointed=True, max_words=0, spill_directory=""):
+        """
+        Class to store the assignment results.
+        Stores:
+            The number of unique pages
+            The longest length of a page
+            A dictionary of words
+            A dictionary of subdomains
+        The results are checkpointed to disk once they are dirty and either
+        checkpoint_interval seconds or checkpoint_pages pages have passed.
+        The reports list the report_top_words most common words and the
+        report_top_subdomains largest subdomains (0 lists all of them).
+        Results that are only reported, like those merged from the shards of
+        a distributed crawl, are created with checkpointed False so they are
+        never checkpointed over the crawl's own.
+        One Results is shared by all the workers of a crawl. They count into
+        their own ResultsDelta, which is merged in under the lock every few
+        pages, so the words are not locked once per page.
+        At most max_words words are kept in memory, the others are spilled
+        to sorted runs in spill_directory (see utils.word_counts).
+        """
+        self.unique_pages = 0
+        self.longest_page_count = 0
+        self.longest_page = ""
+        self.words = WordCounter(max_words, spill_directory)
+        self.subdomains = defaultdict(int)
+        self.stopwords = STOPWORDS
+
+        self.report_top_words = report_top_words
+        self.report_top_subdomains = report_top_subdomains
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_pages = checkpoint_pages
+        # Guards the counts, which all the workers of a crawl merge into.
+        self.lock = threading.RLock()
+        # Keeps checkpoints in order, so an older one never overwrites a newer.
+        # Reentrant, as the signal handlers checkpoint on the main thread.
+        self.checkpoint_lock = threading.RLock()
+        # The thread checkpointing, if any.
+        self.checkpoint_thread = None
+        self.dirty = False
+        self.pages_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+        if checkpointed:
+            _LIVE_RESULTS.add(self)
+
+    def add_subdomain(self, url) -> None:
+        """
+        Adds a subdomain to the subdomain results.
+        If a given URL has a previously recorded subdomain, increments the
+        subdomain's counter.
+        :param url: the url with the subdomain of interest.
+        :return: None
+        """
+        subdomain = subdomain_of(url)
+
+        if subdomain:
+            with self.lock:
+                self.dirty = True
+                if subdomain in self.subdomains:
+                    self.subdomains[subdomain] += 1
+                else:
+                    self.subdomains[subdomain] = 1
+
+    def add_unique_page(self, url) -> None:
+        """
+        Counts a url as a unique page. The frontier's seen set decides which
+        urls are unique, so this must be called once per url.
+        :param url: the url to add
+        :return: void
+        """
+        with self.lock:
+            self.unique_pages += 1
+            self.add_subdomain(url)
+
+    def update_longest_length(self, count, url) -> None:
+        """
+        Updates the current longest page length, if the
+        passed length is greater.
+        :param count: the count of the current page
+        :return: void
+        """
+        with self.lock:
+            if count > self.longest_page_count:
+                self.longest_page_count = count
+                self.longest_page = url
+                self.dirty = True
+
+    def add_word(self, new_word) -> None:
+        """
+        Adds the passed word to the word dict.
+        If the word is already in the dict, increment its counter.
+        :param new_word:
+        :return:
+        """
+        word = new_word.lower()
+        if word not in self.stopwords:
+            with self.lock:
+                spill = self.words.update({word: 1})
+                self.dirty = True
+            if spill:
+                self.words.spill()
+        else:
+            pass
+
+    def add_words(self, words) -> None:
+        """
+        Adds all the words of a page to the word dict at once.
+        :param words: an iterable of lowercased words.
+        :return: None
+        """
+        self.add_word_counts(Counter(words))
+
+    def add_word_counts(self, counts) -> None:
+        """
+        Adds the counts of a page's words to the word dict. Stop words are
+        filtered out with one set intersection, and the rest merged with a
+        single update.
+        :param counts: a mapping of lowercased word -> count.
+        :return: None
+        """
+        stopped = self.stopwords.intersection(counts)
+        if stopped:
+            counts = {word: count for word, count in counts.items()
+                      if word not in stopped}
+        if counts:
+            with self.lock:
+                spill = self.words.update(counts)
+                self.dirty = True
+            if spill:
+                # Written outside the lock, so the workers keep counting.
+                self.words.spill()
+
+    def get_words(self) -> list:
+        """
+        Sorts the dict by most frequent word first, then returns it.
+        :return: the sorted dictionary of words.
+        """
+        return self.words
+
+    def get_subdomains(self) -> dict:
+        """
+        Returns the list of subdomains.
+        :return: the dictionary of subdomains.
+        """
+        return self.subdomains
+
+    def export_counts(self) -> dict:
+        """
+        Gets the counts of these results, to be merged into other results.
+        The words are streamed from a snapshot, so the spilled ones are
+        never all loaded at once.
+        :return: a dict of the unique page count, longest page and its word
+            count, subdomains, and words as an iterator of (word, count).
+        """
+        with self.lock:
+            return {
+                "unique_pages": self.unique_pages,
+                "longest_page_count": self.longest_page_count,
+                "longest_page": self.longest_page,
+                "words": self.words.snapshot().stream(),
+                "subdomains": dict(self.subdomains),
+            }
+
+    def merge_counts(self, counts) -> None:
+        """
+        Adds the counts of other results, as given by export_counts.
+        :param counts: the counts to add, with words as a mapping or an
+            iterable of (word, count).
+        :return: None
+        """
+        with self.lock:
+            self.unique_pages += counts["unique_pages"]
+            self.update_longest_length(counts["longest_page_count"], counts["longest_page"])
+            for subdomain, count in counts["subdomains"].items():
+                self.subdomains[subdomain] = self.subdomains.get(subdomain, 0) + count
+            self.dirty = True
+        self.merge_words(counts["words"])
+
+    def merge_words(self, words) -> None:
+        """
+        Adds word counts, a batch of MERGE_BATCH words at a time when they
+        are streamed.
+        :param words: a mapping of word -> count, or an iterable of (word,
+            count).
+        :return: None
+        """
+        if isinstance(words, Mapping):
+            self.add_word_counts(words)
+            return
+        words = iter(words)
+        while True:
+            batch = dict(islice(words, MERGE_BATCH))
+            if not batch:
+                return
+            self.add_word_counts(batch)
+
+    def page_done(self, pages=1) -> None:
+        """
+        Records that pages have been processed, and checkpoints the results
+        if enough time or pages have passed since the last checkpoint.
+        :param pages: the number of pages processed.
+        :return: None
+        """
+        with self.lock:
+            self.pages_since_checkpoint += pages
+            due = (self.pages_since_checkpoint >= self.checkpoint_pages
+                   or time.monotonic() - self.last_checkpoint >= self.checkpoint_interval)
+        if due:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Exports the results needed for stopping and continuing, if anything
+        changed since the last checkpoint.
+        :return: None
+        """
+        with self.checkpoint_lock:
+            owner, self.checkpoint_thread = self.checkpoint_thread, threading.get_ident()
+            try:
+                self._checkpoint()
+            finally:
+                self.checkpoint_thread = owner
+        if _DEFERRED_SIGNALS and threading.current_thread() is threading.main_thread():
+            signum = _DEFERRED_SIGNALS.pop()
+            _DEFERRED_SIGNALS.clear()
+            _stop(signum)
+
+    def _checkpoint(self) -> None:
+        with self.lock:
+            self.pages_since_checkpoint = 0
+            self.last_checkpoint = time.monotonic()
+            if not self.dirty:
+                return
+            self.dirty = False
+        with METRICS.timer("checkpoint"):
+            self.export_word_json()
+            self.export_subdomain_json()
+            self.export_longest_count()
+            self.export_longest_page()
+
+    def write_reports(self, full=False) -> None:
+        """
+        Writes the human readable word and subdomain reports.
+        :param full: list every word and subdomain instead of the top ones.
+        :return: None
+        """
+        self.print_subdomains(0 if full else None)
+        self.print_words(0 if full else None)
+
+    def print_subdomains(self, top=None) -> None:
+        """
+        Writes the subdomains to file.
+        :param top: how many subdomains to list, 0 for all of them. Defaults
+                    to report_top_subdomains.
+        """
+        if top is None:
+            top = self.report_top_subdomains
+        with self.lock:
+            subdomains = dict(self.subdomains)
+        sorted_dict = top_counts(subdomains, top)
+
+        def write(file):
+            for subdomain, count in sorted_dict:
+                file.write(subdomain + " -> " + str(count) + "\n")
+
+        atomic_write("subdomainOutput.txt", write)
+
+    def print_words(self, top=None) -> None:
+        """
+        Writes the words to file.
+        :param top: how many words to list, 0 for all of them. Defaults to
+                    report_top_words.
+        """
+        if top is None:
+            top = self.report_top_words
+        with self.lock:
+            words = self.words.snapshot()
+        with words:
+            sorted_dict = words.most_common(top)
+
+            def write(file):
+                for word, count in sorted_dict:
+                    file.write(word + " -> " + str(count) + "\n")
+
+            atomic_write("words.txt", write)
+
+    def export_word_json(self):
+        """
+        Exports the results.words dictionary to json, one word per line.
+        For stopping and continuing.
+        :return: None
+        """
+        with self.lock:
+            words = self.words.snapshot()
+        with words:
+            atomic_write("wordJSON.json", words.write_json)
+
+    def import_word_json(self):
+        """
+        Imports the results.words dictionary from json.
+        For stopping and continuing.
+        :return: None
+        """
+        self.words.clear()
+        self.words.read_json("wordJSON.json")
+
+    def export_subdomain_json(self):
+        """
+        Exports the subdomains to json.
+        :return: None
+        """
+        with self.lock:
+            subdomains = dict(self.subdomains)
+        atomic_write("subdomainJSON.json", lambda outfile: json.dump(subdomains, outfile))
+
+    def import_subdomain_json(self):
+        """
+        Imports the subdomains from json.
+        :return: None
+        """
+        infile = open("subdomainJSON.json", "r")
+        self.subdomains = json.load(infile)
+
+        infile.close()
+
+    def export_log(self):
+        """
+        Updates the log file with crawl starts.
+        :return:
+        """
+        infile = open("log.txt", 'a')
+        infile.write(str(self.longest_page_count) + " " + str(datetime.now()) + "\n")
+
+        infile.close()
+
+    def export_longest_count(self):
+        """
+        Records the longest page count found.
+        :return: None.
+        """
+        count = self.longest_page_count
+        atomic_write("longest_count.txt",
+                     lambda outfile: outfile.write(str(count)))
+
+    def import_longest_count(self):
+        """
+        Loads the longest page count found.
+        :return:
+        """
+        infile = open("longest_count.txt", 'r')
+        self.longest_page_count = int(infile.readline())
+
+        infile.close()
+
+    def export_longest_page(self):
+        """
+        Records the longest page found
+        :return: None.
+        """
+        page = self.longest_page
+        atomic_write("longest_page.txt",
+                     lambda outfile: outfile.write(page + "\n"))
+
+    def import_longest_page(self):
+        """
+        Loads the longest file found
+        :return:
+        """
+        infile = open("longest_page.txt", 'r')
+        self.longest_page = infile.readline().rstrip("\n")
+
+        infile.close()
+
+    def import_longest(self):
+        """
+        Loads the longest page and its count.
+        :return: None
+        """
+        self.import_longest_count()
+        self.import_longest_page()
+
+    def load(self) -> None:
+        """
+        Loads the results of a previous crawl, if there are any, and logs
+        the start of this one.
+        :return: None
+        """
+        try:
+            self.import_subdomain_json()
+            self.import_word_json()
+            self.import_longest()
+        except FileNotFoundError:
+            print("Running for first time")
+
+        self.export_log()
+
+
+class ResultsDelta:
+    def __init__(self, results, merge_pages=25, merge_interval=5.0):
+        """
+        The counts of one worker since they were last merged into the
+        Results shared by the crawl. Counting into it takes no lock; it is
+        merged into the shared results under their lock once merge_pages
+        pages or merge_interval seconds have passed, and when the worker
+        finishes.
+        Has the same methods as Results for counting pages.
+        """
+        self.results = results
+        self.merge_pages = merge_pages
+        self.merge_interval = merge_interval
+        self.unique_pages = 0
+        self.longest_page_count = 0
+        self.longest_page = ""
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.pages = 0
+        self.last_merge = time.monotonic()
+
+    def add_unique_page(self, url) -> None:
+        self.unique_pages += 1
+        subdomain = subdomain_of(url)
+        if subdomain:
+            self.subdomains[subdomain] += 1
+
+    def update_longest_length(self, count, url) -> None:
+        if count > self.longest_page_count:
+            self.longest_page_count = count
+            self.longest_page = url
+
+    def add_word_counts(self, counts) -> None:
+        """
+        Adds the counts of a page's words. Stop words are filtered out when
+        the delta is merged, once for all its pages.
+        :param counts: a mapping of lowercased word -> count.
+        :return: None
+        """
+        self.words.update(counts)
+
+    def page_done(self) -> None:
+        """
+        Records that a page has been processed, and merges the delta if
+        enough time or pages have passed since the last merge.
+        :return: None
+        """
+        self.pages += 1
+        if (self.pages >= self.merge_pages
+                or time.monotonic() - self.last_merge >= self.merge_interval):
+            self.merge()
+
+    def merge(self) -> None:
+        """
+        Adds the counts into the shared results, which checkpoint themselves
+        when due, and starts a new delta.
+        :return: None
+        """
+        pages = self.pages
+        if pages or self.unique_pages or self.words:
+            self.results.merge_counts({
+                "unique_pages": self.unique_pages,
+                "longest_page_count": self.longest_page_count,
+                "longest_page": self.longest_page,
+                "words": self.words,
+                "subdomains": self.subdomains,
+            })
+        self.unique_pages = 0
+        self.longest_page_count = 0
+        self.longest_page = ""
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.pages = 0
+        self.last_merge = time.monotonic()
+        if pages:
+            self.results.page_done(pages)
@@ -0,0 +1,163 @@
+import re
+
+from collections import OrderedDict
+from threading import Lock
+
+from utils.canonical import canonicalize
+
+NUMBER_PATTERN = re.compile(r"\d+")
+DATE_PATTERN = re.compile(r"\d{4}[-_/]\d{1,2}(?:[-_/]\d{1,2})?")
+HEX_PATTERN = re.compile(r"[0-9a-fA-F]{16,}")
+
+# Indexes into a template's statistics.
+DISCOVERED, FETCHED, NOVEL, RECENT = range(4)
+
+
+class TrapDetector:
+    """
+    Class to learn traps from the urls being crawled.
+    Urls are grouped by a path template: the host and path with dates,
+    numbers and long hex ids collapsed, plus the sorted query keys. For each
+    template it counts the links discovered, the pages fetched and the pages
+    that had new content. Templates that keep producing pages without new
+    content are throttled, and then blocked.
+    Only the max_templates most recently used templates and the max_blocked
+    most recently hit blocked templates are kept, so memory stays bounded
+    however long the crawl runs. A blocked template that is forgotten is
+    blocked again by its next repeated page, if its statistics are still
+    kept.
+    """
+
+    def __init__(self, min_pages=10, throttle_novelty=0.5, block_novelty=0.1,
+                 throttle_every=4, max_templates=20000, recent_size=8,
+                 max_blocked=10000):
+        self.min_pages = min_pages
+        self.throttle_novelty = throttle_novelty
+        self.block_novelty = block_novelty
+        self.throttle_every = throttle_every
+        self.max_templates = max_templates
+        self.recent_size = recent_size
+        self.max_blocked = max_blocked
+
+        self.lock = Lock()
+        self.templates = OrderedDict()
+        # Blocked templates, least recently hit first. Checked without the
+        # lock, only changed with it.
+        self.blocked = OrderedDict()
+
+    @staticmethod
+    def template(url):
+        """
+        Collapses a url into its path template.
+        e.g. https://wics.ics.uci.edu/events/2021-05-03/?ical=1&tribe-bar-date=x
+             -> wics.ics.uci.edu/events/{d}/?ical&tribe-bar-date
+        :param url: the url.
+        :return: the template string.
+        """
+        parts = canonicalize(url)
+        if parts is None:
+            return url
+        path = DATE_PATTERN.sub("{d}", parts.path)
+        path = HEX_PATTERN.sub("{h}", path)
+        path = NUMBER_PATTERN.sub("{n}", path)
+        keys = sorted({pair.partition("=")[0] for pair in parts.query.split("&") if pair})
+        return f"{parts.host}{path}?{'&'.join(keys)}"
+
+    def _stats(self, template):
+        """
+        Gets the statistics of a template, evicting the least recently used
+        template if there are too many. Must be called with the lock held.
+        """
+        stats = self.templates.get(template)
+        if stats is None:
+            stats = self.templates[template] = [0, 0, 0, []]
+            if len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+        else:
+            self.templates.move_to_end(template)
+        return stats
+
+    def novelty(self, stats):
+        """
+        :return: the fraction of fetched pages with new content, or None if
+            too few pages were fetched to tell.
+        """
+        if stats[FETCHED] < self.min_pages:
+            return None
+        return stats[NOVEL] / stats[FETCHED]
+
+    def is_blocked(self, url):
+        """
+        Checks whether the url's template has been blocked.
+        :param url: the url to check.
+        :return: True if the url should not be crawled.
+        """
+        return self.template(url) in self.blocked
+
+    def assess(self, url):
+        """
+        Estimates how promising a url is from what its template has shown so
+        far, without recording anything.
+        :param url: the url.
+        :return: (novelty, risk). Novelty is 1 for the first link of a
+            template and falls as more are discovered. Risk is the fraction
+            of the template's fetched pages without new content, 0 until
+            enough pages were fetched to tell, and 1 once it is blocked.
+        """
+        template = self.template(url)
+        if template in self.blocked:
+            return 0.0, 1.0
+        stats = self.templates.get(template)
+        if stats is None:
+            return 1.0, 0.0
+        novelty = self.novelty(stats)
+        return (1.0 / max(1, stats[DISCOVERED]),
+                0.0 if novelty is None else 1.0 - novelty)
+
+    def observe(self, url):
+        """
+        Records a discovered link and decides whether to crawl it.
+        :param url: the discovered url.
+        :return: True if the url should be added to the frontier.
+        """
+        template = self.template(url)
+        if template in self.blocked:
+            with self.lock:
+                if template in self.blocked:
+                    self.blocked.move_to_end(template)
+            return False
+        with self.lock:
+            stats = self._stats(template)
+            stats[DISCOVERED] += 1
+            novelty = self.novelty(stats)
+            if novelty is not None and novelty < self.throttle_novelty:
+                # Only let a sample of the template's links through.
+                return stats[DISCOVERED] % self.throttle_every == 0
+        return True
+
+    def record_page(self, url, fingerprint):
+        """
+        Records a fetched page and whether its content was new for its
+        template, blocking the template if it keeps repeating itself.
+        :param url: the fetched url.
+        :param fingerprint: a hashable fingerprint of the page's content.
+        :return: True if the template has just been blocked.
+        """
+        template = self.template(url)
+        with self.lock:
+            stats = self._stats(template)
+            stats[FETCHED] += 1
+            recent = stats[RECENT]
+            if fingerprint not in recent:
+                stats[NOVEL] += 1
+                recent.append(fingerprint)
+                if len(recent) > self.recent_size:
+                    del recent[0]
+            novelty = self.novelty(stats)
+            if (novelty is not None and novelty < self.block_novelty
+                    and template not in self.blocked):
+                self.blocked[template] = True
+                if len(self.blocked) > self.max_blocked:
+                    self.blocked.popitem(last=False)
+                return True
+        return False
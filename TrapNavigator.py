@@ -1,62 +1,173 @@
-from urllib.parse import urlparse
-
-class TrapNavigator:
-    """
-    Class to prevent traps.
-    """
-
-    def __init__(self):
-        self.start_traps = [
-            "wiki.ics.uci.edu/doku.php",
-            "www.informatics.uci.edu/files/pdf/InformaticsBrochure-March2018",
-            "www.ics.uci.edu/ugrad/current/policies/index.php",
-            "www.ics.uci.edu/ugrad/policies",
-            "www.ics.uci.edu/about/brenhall/index.php/",
-            "www.ics.uci.edu/brenhall/brenhall",
-            "www.ics.uci.edu/ugrad/policies/",
-            "www.stat.uci.edu/damonbayer/uci_covid19_dashboard",
-            "www.stat.uci.edu/damonbayer/uci_covid19_dashboard/blob/",
-            "wics.ics.uci.edu/events/202",
-            "archive.ics.uci.edu/ml/datasets/datasets/",
-            "www.ics.uci.edu/honors/honors/",
-            "www.ics.uci.edu/ugrad/honors/index.php"
-        ]
-
-        self.end_traps = [
-            "@uci.edu",
-            "@ics.uci.edu",
-            "@gmail.com",
-            "void(0)"
-        ]
-        
-    def check_for_traps(self, url):
-        """
-        Run trap checks on the passed url.
-        :param url: the url to check
-        :return:
-        """
-        if self.known_traps(url):
-            return True
-        else:
-            return False
-
-        # return self.similarity_check(url, tokens)
-
-    def known_traps(self, new_url):
-        """
-        Checks for known traps.
-        :param new_url: the url to check.
-        :return:
-        """
-        parsed = urlparse(new_url)
-        noSchemeURL = parsed.netloc + parsed.path
-
-        for s_trap in self.start_traps:
-            if noSchemeURL.startswith(s_trap):
-                return True
-
-        for e_trap in self.end_traps:
-            if noSchemeURL.endswith(e_trap):
-                return True
-
-        return False
+import json
+import os
+import re
+import time
+
+from threading import Lock
+
+from utils import get_logger
+from utils.canonical import canonicalize
+
+class TrapNavigator:
+    """
+    Class to prevent traps.
+    The trap rules are loaded from a json file with two lists:
+        start_traps: urls (without the scheme) starting with these are traps.
+        end_traps: urls (without the scheme) ending with these are traps.
+    The start traps are compiled into one anchored regex per host, so a
+    lookup only looks at the rules of the url's own host. The file is
+    reloaded when it changes, without restarting the crawl.
+    """
+
+    def __init__(self, trap_file="traps.json", reload_interval=5.0):
+        self.trap_file = trap_file
+        self.logger = get_logger("TRAPS", "CRAWLER")
+        self.reload_interval = reload_interval
+        self.reload_lock = Lock()
+        self.loaded_mtime = None
+        self.next_reload_check = 0.0
+
+        self.start_traps = []
+        self.end_traps = []
+        # host -> compiled regex matching the trapped path prefixes.
+        self.host_traps = {}
+        # Regex matching the trapped prefixes of rules without a path.
+        self.netloc_traps = None
+        self.end_suffixes = ()
+        self.reload()
+
+    def reload(self):
+        """
+        Loads and compiles the trap rules from the trap file. If the file
+        cannot be read or parsed, the previous rules are kept, until the
+        file changes again. A missing file leaves no rules.
+        :return: None
+        """
+        with self.reload_lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.trap_file)
+                with open(self.trap_file, "r") as infile:
+                    rules = json.load(infile)
+                start_traps, end_traps = self.parse_rules(rules)
+            except FileNotFoundError:
+                if self.trap_file:
+                    self.logger.warning(
+                        f"Trap file {self.trap_file} not found, "
+                        f"no trap rules are applied.")
+                start_traps, end_traps = [], []
+            except (OSError, ValueError) as error:
+                self.logger.warning(
+                    f"Could not load trap file {self.trap_file}, keeping the "
+                    f"previous rules: {error}")
+                # Not retried until the file changes, or it would warn
+                # every reload_interval.
+                self.loaded_mtime = mtime
+                return
+            self.compile(start_traps, end_traps)
+            self.loaded_mtime = mtime
+
+    @staticmethod
+    def parse_rules(rules):
+        """
+        Checks the rules read from the trap file.
+        :param rules: the parsed json.
+        :return: (start_traps, end_traps).
+        :raises ValueError: if the rules are not lists of strings.
+        """
+        if not isinstance(rules, dict):
+            raise ValueError("the trap file must hold a json object")
+        traps = (rules.get("start_traps", []), rules.get("end_traps", []))
+        for trap_list in traps:
+            if (not isinstance(trap_list, list)
+                    or not all(isinstance(trap, str) for trap in trap_list)):
+                raise ValueError("start_traps and end_traps must be lists of strings")
+        return traps
+
+    def compile(self, start_traps, end_traps):
+        """
+        Compiles the trap rules into per host lookups.
+        :param start_traps: the list of trapped url prefixes.
+        :param end_traps: the list of trapped url suffixes.
+        :return: None
+        """
+        prefixes_by_host = {}
+        netloc_prefixes = []
+        for s_trap in start_traps:
+            host, slash, path = s_trap.partition("/")
+            if slash:
+                prefixes_by_host.setdefault(host.lower(), []).append("/" + path)
+            else:
+                netloc_prefixes.append(host.lower())
+
+        # Longest prefixes first, so a regex never has to backtrack far.
+        host_traps = {
+            host: re.compile("|".join(
+                re.escape(prefix)
+                for prefix in sorted(prefixes, key=len, reverse=True)))
+            for host, prefixes in prefixes_by_host.items()
+        }
+        netloc_traps = re.compile("|".join(
+            re.escape(prefix) for prefix in netloc_prefixes)) if netloc_prefixes else None
+
+        # Swap in the new rules all at once, for threads checking urls.
+        self.host_traps, self.netloc_traps, self.end_suffixes = (
+            host_traps, netloc_traps, tuple(end_traps))
+        self.start_traps = list(start_traps)
+        self.end_traps = list(end_traps)
+
+    def reload_if_changed(self):
+        """
+        Reloads the trap file if it was modified. Checks at most once every
+        reload_interval seconds.
+        :return: None
+        """
+        now = time.monotonic()
+        if now < self.next_reload_check:
+            return
+        self.next_reload_check = now + self.reload_interval
+        try:
+            mtime = os.path.getmtime(self.trap_file)
+        except FileNotFoundError:
+            mtime = None
+        except OSError as error:
+            self.logger.warning(
+                f"Could not check trap file {self.trap_file}, keeping the "
+                f"current rules: {error}")
+            return
+        if mtime != self.loaded_mtime:
+            self.reload()
+
+    def check_for_traps(self, url):
+        """
+        Run trap checks on the passed url.
+        :param url: the url to check
+        :return:
+        """
+        if self.known_traps(url):
+            return True
+        else:
+            return False
+
+        # return self.similarity_check(url, tokens)
+
+    def known_traps(self, new_url):
+        """
+        Checks for known traps.
+        :param new_url: the url to check.
+        :return:
+        """
+        self.reload_if_changed()
+        parsed = canonicalize(new_url)
+        if parsed is None:
+            return False
+        netloc = parsed.host
+
+        host_trap = self.host_traps.get(netloc)
+        if host_trap is not None and host_trap.match(parsed.path):
+            return True
+
+        if self.netloc_traps is not None and self.netloc_traps.match(netloc):
+            return True
+
+        return (netloc + parsed.path).endswith(self.end_suffixes)
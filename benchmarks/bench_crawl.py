@@ -0,0 +1,130 @@
+"""
+Runs the full Crawler against a local stand-in for the cache server and
+measures it end to end.
+
+    python -m benchmarks.bench_crawl [--threads 4] [--async_download]
+        [--parse_processes 0] [--politeness 0.0] [--config_file config.ini]
+        [site options of benchmarks.cache_server]
+
+The cache server runs in its own process, so that only the crawler is
+measured. The crawl starts from the site's seeds in a temporary directory,
+with the other options of the config file, and reports:
+    pages/sec:      requests answered by the cache server per second.
+    CPU per page:   user and system time of the crawler, and of the parse
+                    processes, per request.
+    peak RSS:       the largest resident set of the crawler process.
+    I/O per page:   bytes the crawler read and wrote to disk per request.
+    stages:         the summary of utils.metrics, with the median and 95th
+                    percentile time of every stage of the crawl loop.
+"""
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.cache_server import add_site_arguments, make_server, make_site
+from utils.config import Config
+from utils.metrics import METRICS
+from crawler import Crawler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(args, ready, served):
+    server = make_server(make_site(args), latency=args.latency,
+                         jitter=args.jitter, counter=served)
+    ready.send(server.server_port)
+    server.serve_forever()
+
+
+def disk_io():
+    """
+    :return: (bytes read, bytes written) by this process, from /proc on
+        Linux, or from the block counts of getrusage elsewhere.
+    """
+    if os.path.exists("/proc/self/io"):
+        with open("/proc/self/io") as infile:
+            fields = dict(line.split(": ") for line in infile.read().splitlines())
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+
+def cpu_time():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default=os.path.join(ROOT, "config.ini"))
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--async_download", action="store_true", default=False)
+    parser.add_argument("--parse_processes", type=int, default=0)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", default=False)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    served = multiprocessing.Value("q", 0)
+    server = multiprocessing.Process(
+        target=serve, args=(args, sender, served), daemon=True)
+    server.start()
+    port = receiver.recv()
+
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(make_site(args).seed_urls())
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["CRAWLER"]["TRAPFILE"] = os.path.join(ROOT, "traps.json")
+    cparser["CONNECTION"]["ASYNCDOWNLOAD"] = str(args.async_download)
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    cparser["LOCAL PROPERTIES"]["PARSEPROCESSES"] = str(args.parse_processes)
+    cparser["DISTRIBUTED"]["SHARDS"] = ""
+    cparser["LOCAL PROPERTIES"]["METRICSPORT"] = "0"
+    cparser["LOCAL PROPERTIES"]["METRICSINTERVAL"] = "0"
+    config = Config(cparser)
+    config.cache_server = ("127.0.0.1", port)
+    if not args.verbose:
+        # The per page log lines would dominate the measurements.
+        logging.disable(logging.INFO)
+
+    workdir = tempfile.mkdtemp(prefix="bench_crawl")
+    os.chdir(workdir)
+    try:
+        io_before = disk_io()
+        cpu_before = cpu_time()
+        start = time.perf_counter()
+        Crawler(config, True).start()
+        elapsed = time.perf_counter() - start
+        own_cpu, parse_cpu = (after - before for after, before in zip(cpu_time(), cpu_before))
+        read, written = (after - before for after, before in zip(disk_io(), io_before))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.terminate()
+
+    pages = max(1, served.value)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    print(f"{served.value} pages in {elapsed:.2f} s")
+    print(f"   pages/sec: {served.value / elapsed:10,.1f}")
+    print(f"CPU per page: {1000 * own_cpu / pages:10,.3f} ms crawler, "
+          f"{1000 * parse_cpu / pages:,.3f} ms parse processes")
+    print(f"    peak RSS: {peak_rss / 1024:10,.1f} MB")
+    print(f"I/O per page: {read / pages:10,.0f} B read, {written / pages:,.0f} B written")
+    print(f"      stages: {METRICS.summary()}")
+
+
+if __name__ == "__main__":
+    main()
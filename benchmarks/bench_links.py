@@ -0,0 +1,169 @@
+"""
+Measures how fast scraped links go through the checks between a page and
+the frontier, comparing the old chain, which parsed every link again in
+each check, against the chain sharing one utils.canonical parse.
+
+    python -m benchmarks.bench_links [--repeat N] [site arguments]
+
+The links are collected from the synthetic site of benchmarks.cache_server,
+or from a recorded one with --corpus.
+"""
+import re
+import time
+
+from argparse import ArgumentParser
+from collections import Counter, deque
+from hashlib import blake2b
+from urllib.parse import urlparse, urljoin, urlsplit
+
+import scraper
+
+from TrapDetector import TrapDetector, DATE_PATTERN, HEX_PATTERN, NUMBER_PATTERN
+from TrapNavigator import TrapNavigator
+from benchmarks.cache_server import make_site, add_site_arguments
+from crawler.scoring import UrlScorer
+from utils import canonical
+from utils.page import parse_content
+from utils.seen import url_fingerprint
+
+
+def collect_links(site, limit):
+    """
+    :return: a list of (page url, links of the page) of up to limit pages,
+        found breadth first from the seeds of the site.
+    """
+    pages = list()
+    queue = deque(site.seed_urls())
+    queued = set(queue)
+    while queue and len(pages) < limit:
+        url = queue.popleft()
+        status, content, _ = site.get(url)
+        if status != 200:
+            continue
+        links = parse_content(content).links
+        pages.append((url, links))
+        for link in links:
+            absolute = urljoin(url, link).split("#", 1)[0]
+            if absolute not in queued:
+                queued.add(absolute)
+                queue.append(absolute)
+    return pages
+
+
+def legacy_fingerprint(url):
+    parsed = urlparse(url)
+    key = (f"{parsed.netloc.lower()}/{parsed.path.rstrip('/')}/{parsed.params}/"
+           f"{parsed.query}/{parsed.fragment}")
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def legacy_template(url):
+    parts = urlsplit(url)
+    path = DATE_PATTERN.sub("{d}", parts.path)
+    path = HEX_PATTERN.sub("{h}", path)
+    path = NUMBER_PATTERN.sub("{n}", path)
+    keys = sorted({pair.partition("=")[0] for pair in parts.query.split("&") if pair})
+    return f"{parts.netloc.lower()}{path}?{'&'.join(keys)}"
+
+
+def legacy_path_risk(url):
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if len(segments) < 2:
+        return 0.0
+    return 1.0 - len(set(segments)) / len(segments)
+
+
+def legacy_valid(url):
+    if re.match(re.compile(r".*@(uci.edu|ics.uci.edu)"), url):
+        return False
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    if max(Counter(parsed.path[1:].split("/")).values()) >= 3:
+        return False
+    if re.match(scraper.EXTENSIONS_PATTERN, parsed.path.lower()):
+        return False
+    return re.match(scraper.DOMAIN_PATTERN, parsed.netloc.lower()) is not None
+
+
+def legacy_chain(pages, navigator):
+    """ The checks as done before, each parsing the link on its own. """
+    kept = list()
+    for url, hrefs in pages:
+        links = [urljoin(href, urlparse(href).path) for href in hrefs]
+        for i in range(len(links)):
+            parsed = urlparse(links[i])
+            if not parsed.netloc and parsed.path:
+                links[i] = urljoin(url, links[i])
+        for link in links:
+            if not legacy_valid(link):
+                continue
+            parsed = urlparse(link)
+            if navigator.host_traps.get(parsed.netloc.lower()) is not None:
+                continue
+            legacy_template(link)
+            legacy_fingerprint(link)
+            legacy_fingerprint(url)
+            legacy_path_risk(link)
+            urlparse(link).netloc.lower()
+            kept.append(link)
+    return kept
+
+
+def canonical_chain(pages, navigator, detector):
+    """ The checks as done now, sharing the parts of the canonical link. """
+    kept = list()
+    for url, hrefs in pages:
+        for href in hrefs:
+            parts = canonical.canonicalize(href, url, strip_query=True)
+            if parts is None:
+                continue
+            link = parts.url
+            if not scraper.is_valid(link) or navigator.known_traps(link):
+                continue
+            detector.template(link)
+            url_fingerprint(link)
+            url_fingerprint(url)
+            UrlScorer.path_risk(link)
+            canonical.canonicalize(link).host
+            kept.append(link)
+    return kept
+
+
+def measure(name, function, links, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        kept = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {links * repeat / elapsed:14,.0f} links/sec")
+    return kept, elapsed
+
+
+def main():
+    parser = ArgumentParser()
+    add_site_arguments(parser)
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = collect_links(make_site(args), args.limit)
+    links = sum(len(hrefs) for _, hrefs in pages)
+    print(f"{len(pages)} pages, {links:,} links")
+
+    # Neither chain asks robots.txt or the visited set, only the checks.
+    scraper.set_robots(None)
+    navigator = TrapNavigator(trap_file="")
+    detector = TrapDetector()
+    canonical._CACHE.clear()
+
+    before, legacy = measure(
+        "before", lambda: legacy_chain(pages, navigator), links, args.repeat)
+    after, current = measure(
+        "after", lambda: canonical_chain(pages, navigator, detector),
+        links, args.repeat)
+    print(f"{legacy / current:.2f}x faster")
+    assert len(before) == len(after), "The chains kept different links."
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measures how fast page tokens are counted into Results, comparing the old
+per-token add_word loop against the batched add_word_counts.
+
+    python -m benchmarks.bench_words [--corpus DIR] [--repeat N] [--max_words N]
+
+The corpus is a directory of saved pages (any files, parsed as html). Without
+one, synthetic pages are generated. With --max_words, the batched counts
+spill to disk past that many words, as with SPILLWORDS.
+"""
+import os
+import random
+import time
+
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+
+from Results import Results
+from utils.page import parse_content
+
+
+def load_corpus(directory):
+    pages = list()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as infile:
+                pages.append(parse_content(infile.read()).tokens)
+    return pages
+
+
+def synthetic_corpus(pages=500, tokens_per_page=2000, vocabulary=50000):
+    rng = random.Random(0)
+    # Zipf-like vocabulary, with the stop words among the most common words.
+    words = sorted(Results().stopwords) + [f"word{i}" for i in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return [rng.choices(words, weights, k=tokens_per_page) for _ in range(pages)]
+
+
+def legacy_count(pages, stopwords):
+    """ The counting done before batching: a list scan per token. """
+    words = defaultdict(int)
+    for tokens in pages:
+        for token in tokens:
+            word = token.lower()
+            if word not in stopwords:
+                words[word] += 1
+    return words
+
+
+def batched_count(pages, max_words=0):
+    results = Results(max_words=max_words)
+    for tokens in pages:
+        results.add_word_counts(Counter(token.lower() for token in tokens))
+    return dict(results.words.items())
+
+
+def measure(name, function, pages, repeat):
+    tokens = sum(len(tokens) for tokens in pages) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        counted = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {tokens / elapsed:14,.0f} tokens/sec")
+    return counted
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max_words", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    print(f"{len(pages)} pages, {sum(map(len, pages)):,} tokens")
+
+    stopword_list = sorted(Results().stopwords)
+    before = measure(
+        "before", lambda: legacy_count(pages, stopword_list), pages, args.repeat)
+    after = measure(
+        "after", lambda: batched_count(pages, args.max_words), pages, args.repeat)
+    assert dict(before) == dict(after), "Batched counts differ from the loop."
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+A local stand-in for the cache server, answering the same CBOR encoded
+responses, so that the crawler can be run and measured without the
+spacetime servers.
+
+    python -m benchmarks.cache_server [--port 9000] [--corpus DIR]
+        [--hosts 8] [--pages 500] [--links 10] [--words 200 2000]
+        [--trap_rate 0.05] [--latency 0.0] [--jitter 0.0]
+
+Then crawl it with
+    python launch.py --restart --cache_server 127.0.0.1:9000
+
+Pages come from a recorded corpus, a directory with one file per page at
+<host>/<path> (index.html for paths ending in a slash), or else from a
+synthetic site. The synthetic site is generated from the url alone, so it is
+the same on every run. Its hosts link to each other, and some of their pages
+lead into traps: an endless calendar of near identical pages, and links with
+a fresh session id to the same page.
+"""
+import os
+import pickle
+import random
+import threading
+import time
+
+from argparse import ArgumentParser
+from hashlib import blake2b
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+HTML = "text/html; charset=utf-8"
+TEXT = "text/plain; charset=utf-8"
+XML = "application/xml"
+
+
+def _rng(*parts):
+    """ A random generator seeded by the parts, the same on every run. """
+    key = "\0".join(map(str, parts)).encode("utf-8")
+    return random.Random(int.from_bytes(blake2b(key, digest_size=8).digest(), "little"))
+
+
+class SyntheticSite(object):
+    """
+    Generates the pages of hosts host0.ics.uci.edu to host<n-1>.ics.uci.edu,
+    each with pages /page/0 to /page/<pages-1>.
+    A page has links links, most to its own host, and between words[0] and
+    words[1] words drawn from a Zipf-like vocabulary. With probability
+    trap_rate, a link leads into a trap instead.
+    """
+
+    def __init__(self, hosts=8, pages=500, links=10, words=(200, 2000),
+                 trap_rate=0.05, vocabulary=20000, seed=0):
+        self.hosts = [f"host{i}.ics.uci.edu" for i in range(hosts)]
+        self.pages = pages
+        self.links = links
+        self.words = words
+        self.trap_rate = trap_rate
+        self.seed = seed
+        self.vocabulary = [f"w{i}" for i in range(vocabulary)]
+        self.weights = [1 / (rank + 1) for rank in range(vocabulary)]
+
+    def seed_urls(self):
+        return [f"https://{host}/page/0" for host in self.hosts]
+
+    def _text(self, rng, count):
+        return " ".join(rng.choices(self.vocabulary, self.weights, k=count))
+
+    def _link(self, rng, host):
+        if rng.random() < self.trap_rate:
+            if rng.random() < 0.5:
+                day = rng.randrange(365)
+                return f"https://{host}/calendar/{2000 + day // 365}-{day % 365 // 31 + 1:02d}-{day % 31 + 1:02d}"
+            return f"https://{host}/page/{rng.randrange(self.pages)}?session={rng.getrandbits(64):x}"
+        if rng.random() < 0.2:
+            host = rng.choice(self.hosts)
+        return f"https://{host}/page/{rng.randrange(self.pages)}"
+
+    def get(self, url):
+        """
+        :param url: the requested url.
+        :return: (status, content, content type).
+        """
+        parts = urlparse(url)
+        host, path = parts.netloc.lower(), parts.path.rstrip("/") or "/"
+        if host not in self.hosts:
+            return 404, b"", TEXT
+        if path == "/robots.txt":
+            return 200, b"User-agent: *\nDisallow: /private/\n", TEXT
+        if path == "/sitemap.xml":
+            locs = "".join(
+                f"<url><loc>https://{host}/page/{i}</loc></url>"
+                for i in range(0, self.pages, 10))
+            return 200, f"<urlset>{locs}</urlset>".encode("utf-8"), XML
+
+        rng = _rng(self.seed, host, path, parts.query)
+        if path.startswith("/calendar/"):
+            # Every day links to the next, with the same few words.
+            year, month, day = (int(part) for part in path.rsplit("/", 1)[1].split("-"))
+            day += 1
+            if day > 31:
+                month, day = month + 1, 1
+            if month > 12:
+                year, month = year + 1, 1
+            body = (f"<p>Events of {path} {self._text(_rng(self.seed, host), 50)}</p>"
+                    f"<a href='/calendar/{year}-{month:02d}-{day:02d}'>next</a>")
+            return 200, f"<html><body>{body}</body></html>".encode("utf-8"), HTML
+        if not path.startswith("/page/") or not path[6:].isdigit() or int(path[6:]) >= self.pages:
+            return 404, b"", TEXT
+        if parts.query:
+            # Session ids give the same page at another url.
+            rng = _rng(self.seed, host, path, "")
+
+        text = self._text(rng, rng.randint(*self.words))
+        anchors = "".join(
+            f"<a href='{self._link(rng, host)}'>link</a>" for _ in range(self.links))
+        if rng.random() < 0.05:
+            anchors += f"<a href='/private/{rng.randrange(100)}'>private</a>"
+        body = f"<html><head><title>{path}</title></head><body><p>{text}</p>{anchors}</body></html>"
+        return 200, body.encode("utf-8"), HTML
+
+
+class RecordedSite(object):
+    """
+    Serves pages saved in a directory as <host>/<path>, with index.html
+    standing for paths ending in a slash.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def seed_urls(self):
+        return [f"https://{host}/" for host in sorted(os.listdir(self.directory))
+                if os.path.isdir(os.path.join(self.directory, host))]
+
+    def get(self, url):
+        parts = urlparse(url)
+        path = parts.path.lstrip("/")
+        if not path or path.endswith("/"):
+            path += "index.html"
+        root = os.path.abspath(self.directory)
+        file_path = os.path.abspath(os.path.join(root, parts.netloc.lower(), path))
+        if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+            return 404, b"", TEXT
+        with open(file_path, "rb") as infile:
+            content = infile.read()
+        if file_path.endswith(".txt"):
+            return 200, content, TEXT
+        if file_path.endswith(".xml"):
+            return 200, content, XML
+        return 200, content, HTML
+
+
+def encode_response(url, status, content, content_type):
+    """
+    Encodes a page the way the cache server does: a CBOR map holding the
+    pickled requests.Response.
+    :return: the bytes of the answer.
+    """
+    resp = requests.Response()
+    resp.status_code = status
+    resp.url = url
+    resp._content = content
+    resp.headers["Content-Type"] = content_type
+    resp.headers["Content-Length"] = str(len(content))
+    resp.encoding = "utf-8"
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(resp)})
+
+
+def make_server(site, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                counter=None):
+    """
+    Creates the server, not started yet.
+    :param site: a SyntheticSite or RecordedSite.
+    :param latency: seconds waited before answering each request.
+    :param jitter: up to this many more seconds are added at random.
+    :param counter: a multiprocessing.Value also counting the requests, to
+        read them from another process.
+    :return: the ThreadingHTTPServer, with a requests attribute counting
+        the requests served.
+    """
+
+    class CacheHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The headers and the body are written apart on a kept alive
+        # connection. With Nagle's algorithm the body waits for the client's
+        # delayed ack of the headers, about 40 ms a request.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            url = query.get("q", [""])[0]
+            if latency or jitter:
+                time.sleep(latency + random.random() * jitter)
+            body = encode_response(url, *site.get(url))
+            with server.lock:
+                server.requests += 1
+            if counter is not None:
+                with counter.get_lock():
+                    counter.value += 1
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), CacheHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+
+def make_site(args):
+    if args.corpus:
+        return RecordedSite(args.corpus)
+    return SyntheticSite(args.hosts, args.pages, args.links, tuple(args.words),
+                         args.trap_rate, seed=args.seed)
+
+
+def add_site_arguments(parser):
+    parser.add_argument("--corpus", type=str, default=None)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--words", type=int, nargs=2, default=[200, 2000])
+    parser.add_argument("--trap_rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = make_site(args)
+    server = make_server(site, args.host, args.port, args.latency, args.jitter)
+    print(f"Serving on {args.host}:{server.server_port}, "
+          f"seeds: {','.join(site.seed_urls())}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,195 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
 from utils import get_logger
+from utils.async_download import AsyncDownloader
+from utils.simhash import SimhashIndex
+from utils.robots import RobotsCache
+from utils.sitemap import SitemapSeeder
+from utils.content_store import ContentStore
+from utils.content_gate import ContentGate
+from utils.metrics import METRICS
+from Results import Results, install_signal_handlers
+from TrapNavigator import TrapNavigator
+from TrapDetector import TrapDetector
 from crawler.frontier import Frontier
+from crawler.scoring import UrlScorer
 from crawler.worker import Worker
+from crawler.parse_pool import ParsePool
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
-        self.frontier = frontier_factory(config, restart)
+        # Shared by all workers, so traps are learned from the whole crawl.
+        self.trap_detector = TrapDetector()
+        self.frontier = frontier_factory(
+            config, restart, scorer=UrlScorer(config, self.trap_detector))
+        self.trap_navigator = TrapNavigator(config.trap_file)
+        self.robots = None
+        self.sitemap_seeder = None
+        if self.config.obey_robots:
+            if self.config.sitemaps:
+                self.sitemap_seeder = SitemapSeeder(
+                    config, self.frontier, scraper.is_valid, self.logger,
+                    self.config.sitemap_max_urls, is_trap=self.is_trap)
+            self.robots = RobotsCache(
+                config, self.logger, self.config.robots_ttl,
+                getattr(self.frontier, "set_host_delay", None),
+                self.sitemap_seeder.host_discovered if self.sitemap_seeder else None)
+            scraper.set_robots(self.robots)
+        # One copy of the results and trap rules for the whole crawl.
+        self.results = Results(
+            config.checkpoint_interval, config.checkpoint_pages,
+            config.report_top_words, config.report_top_subdomains,
+            max_words=config.spill_words,
+            spill_directory=config.spill_directory)
+        self.results.load()
         self.workers = list()
         self.worker_factory = worker_factory
+        self.simhash_index = SimhashIndex(self.config.near_duplicate_distance)
+        self.content_gate = ContentGate(
+            self.config.content_types, self.config.max_page_bytes,
+            self.config.truncate_page_bytes)
+        self.content_store = None
+        if self.config.content_store:
+            self.content_store = ContentStore(self.config.content_store)
+        self.parse_pool = None
+        if self.config.parse_processes > 0:
+            self.parse_pool = ParsePool(
+                self.config.parse_processes, self.config.parse_queue)
 
-    def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+    def is_trap(self, url):
+        """
+        :return: True if a url is a known or detected trap.
+        """
+        return (self.trap_navigator.known_traps(url)
+                or self.trap_detector.is_blocked(url))
+
+    def create_workers(self):
+        worker_kwargs = dict(
+            trap_detector=self.trap_detector, simhash_index=self.simhash_index,
+            content_gate=self.content_gate, results=self.results,
+            trap_navigator=self.trap_navigator)
+        if self.parse_pool is not None:
+            worker_kwargs["parse_pool"] = self.parse_pool
+        if self.sitemap_seeder is not None:
+            worker_kwargs["sitemap_seeder"] = self.sitemap_seeder
+        if self.content_store is not None:
+            worker_kwargs["content_store"] = self.content_store
+        return [
+            self.worker_factory(
+                worker_id, self.config, self.frontier, **worker_kwargs)
             for worker_id in range(self.config.threads_count)]
+
+    def start_async(self):
+        self.workers = self.create_workers()
         for worker in self.workers:
             worker.start()
 
+    async def run_event_loop(self):
+        """
+        Crawls with the downloads of all workers multiplexed over the pooled
+        connections of one AsyncDownloader, instead of each worker thread
+        blocking on its own download. Each worker keeps taking urls from the
+        frontier while its downloads are in flight, up to
+        DOWNLOADCONCURRENCY downloads for all the workers, and processes the
+        downloaded pages one at a time. The blocking frontier calls and the
+        page processing run in a thread pool with two threads per worker, so
+        they can never starve each other.
+        """
+        self.workers = self.create_workers()
+        loop = asyncio.get_running_loop()
+        downloader = AsyncDownloader(self.config, self.logger)
+        executor = ThreadPoolExecutor(2 * len(self.workers))
+        slots = asyncio.Semaphore(self.config.download_concurrency)
+
+        async def fetch(worker, processing, tbd_url):
+            try:
+                with METRICS.timer("download"):
+                    resp = await downloader.download(tbd_url)
+            finally:
+                slots.release()
+            async with processing:
+                await loop.run_in_executor(
+                    executor, worker.process, tbd_url, resp)
+
+        async def crawl(worker):
+            await loop.run_in_executor(executor, worker.setup)
+            processing = asyncio.Lock()
+            fetches = set()
+            while True:
+                # A url is only taken once it can be downloaded, as its
+                # host's politeness delay starts when it is taken.
+                await slots.acquire()
+                tbd_url = await loop.run_in_executor(executor, worker.next_url)
+                if tbd_url is None:
+                    slots.release()
+                    break
+                task = asyncio.ensure_future(fetch(worker, processing, tbd_url))
+                fetches.add(task)
+                task.add_done_callback(fetches.discard)
+            await asyncio.gather(*fetches)
+            await loop.run_in_executor(executor, worker.finish)
+
+        try:
+            await asyncio.gather(*(crawl(worker) for worker in self.workers))
+        finally:
+            await downloader.close()
+            executor.shutdown()
+
+    def start_metrics(self):
+        """
+        Serves the metrics on METRICSPORT and logs their summary every
+        METRICSINTERVAL seconds, each if configured. Shards of a distributed
+        crawl share the config file, so each serves them on METRICSPORT plus
+        its SHARDID.
+        :return: None
+        """
+        self.metrics_server = None
+        self.metrics_reports = None
+        if self.config.metrics_port:
+            port = self.config.metrics_port
+            if len(self.config.shards) > 1:
+                port += self.config.shard_id
+            try:
+                self.metrics_server = METRICS.serve(self.config.metrics_host, port)
+            except OSError:
+                self.logger.exception(f"Failed to serve the metrics on port {port}.")
+        if self.config.metrics_interval > 0:
+            self.metrics_reports = METRICS.report_every(
+                self.config.metrics_interval, get_logger("METRICS", "CRAWLER"))
+
+    def stop_metrics(self):
+        if self.metrics_reports is not None:
+            self.metrics_reports.set()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        self.logger.info(METRICS.summary())
+
     def start(self):
-        self.start_async()
-        self.join()
+        install_signal_handlers()
+        self.start_metrics()
+        if self.config.async_download:
+            asyncio.run(self.run_event_loop())
+        else:
+            self.start_async()
+            self.join()
+        self.results.checkpoint()
+        self.results.write_reports()
+        # A distributed crawl reports the results of all its shards.
+        merge_results = getattr(self.frontier, "merge_results", None)
+        if merge_results is not None:
+            merge_results([self.results])
+        self.frontier.close()
+        self.stop_metrics()
+        if self.content_store is not None:
+            self.content_store.close()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
 
     def join(self):
         for worker in self.workers:
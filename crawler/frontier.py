@@ -1,72 +1,352 @@
-import os
-import shelve
-
-from threading import Thread, RLock
-from queue import Queue, Empty
-
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
-
-class Frontier(object):
-    def __init__(self, config, restart):
-        self.logger = get_logger("FRONTIER")
-        self.config = config
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
-            # Save file does not exist, but request to load save.
-            self.logger.info(
-                f"Did not find save file {self.config.save_file}, "
-                f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
-            # Save file does exists, but request to start from seed.
-            self.logger.info(
-                f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
-        else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
-
-    def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
-        self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
-
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
-
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
-    def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
-
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+import os
+import time
+
+from heapq import heappush, heappop
+from itertools import count, repeat
+from threading import RLock, Condition
+from utils import get_logger
+from utils.canonical import canonicalize, canonical_url
+from utils.seen import make_seen_set, url_fingerprint
+from scraper import is_valid
+from crawler.journal import FrontierJournal
+from crawler.scoring import UrlScorer
+
+class Frontier(object):
+    def __init__(self, config, restart, scorer=None):
+        self.logger = get_logger("FRONTIER")
+        self.config = config
+        self.scorer = scorer if scorer is not None else UrlScorer(config)
+
+        # Politeness scheduling. Every host gets its own heap of
+        # (score, order, url), so its best url comes out first. Hosts still
+        # cooling down wait in host_heap by the time they may next be fetched
+        # from, and hosts ready to be fetched from wait in ready_heap by the
+        # score of their best url plus their host penalty. ready_keys holds
+        # the current key of each ready host, older entries left in
+        # ready_heap are skipped. The condition is used by workers to wait
+        # for a host to become ready, or for an in progress url to produce
+        # new links.
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
+        self.host_queues = dict()
+        self.host_heap = list()
+        self.ready_heap = list()
+        self.ready_keys = dict()
+        self.host_fetched = dict()
+        self.next_fetch = dict()
+        self.order = count()
+        # Hosts asking for a longer delay than POLITENESS in robots.txt.
+        self.host_delays = dict()
+        self.in_progress = 0
+        # Urls waiting in the host queues. The urls of the journal's pending
+        # url snapshot are read into them STREAMBATCH at a time, whenever
+        # fewer than that are waiting.
+        self.queued = 0
+        self.stream_batch = self.config.stream_batch
+
+        self.journal = FrontierJournal(
+            self.config.save_file, self.config.flush_interval,
+            self.config.flush_batch)
+        if not os.path.exists(self.config.save_file) and not restart:
+            # Save file does not exist, but request to load save.
+            self.logger.info(
+                f"Did not find save file {self.config.save_file}, "
+                f"starting from seed.")
+        elif os.path.exists(self.config.save_file) and restart:
+            # Save file does exists, but request to start from seed.
+            self.logger.info(
+                f"Found save file {self.config.save_file}, deleting it.")
+            self.journal.remove()
+        # Load existing save file, or create one if it does not exist.
+        # Every known url is kept in the seen set as a fingerprint, only the
+        # urls still to be downloaded are kept as (url, depth, score), and
+        # only once they are read from the save file.
+        self.seen = make_seen_set(self.config.seen_set)
+        self.pending = self.journal.load(self.seen)
+        if restart:
+            for url in self.config.seed_urls:
+                self.add_url(url)
+        else:
+            # Set the frontier state with contents of save file.
+            self._parse_save_file()
+            if not self.seen:
+                for url in self.config.seed_urls:
+                    self.add_url(url)
+
+    def _parse_save_file(self):
+        ''' This function can be overridden for alternate saving techniques. '''
+        total_count = len(self.seen)
+        tbd_count = 0
+        with self.lock:
+            for fingerprint, entry in list(self.pending.items()):
+                del self.pending[fingerprint]
+                if self._admit_pending(fingerprint, entry):
+                    tbd_count += 1
+            tbd_count += self._stream_pending()
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {total_count} "
+            f"total urls discovered, {self.journal.unread_pending} more are "
+            f"read from the save file as they are needed.")
+
+    def _admit_pending(self, fingerprint, entry):
+        """
+        Enqueues a url read from the save file, if it is still valid. Must
+        be called with the lock held.
+        :param fingerprint: the fingerprint of the url.
+        :param entry: its (url, depth, priority).
+        :return: True if the url was enqueued.
+        """
+        url, _, priority = entry
+        if not is_valid(url):
+            return False
+        self.pending[fingerprint] = entry
+        self._enqueue(url, priority)
+        return True
+
+    def _stream_pending(self):
+        """
+        Reads urls from the journal's pending url snapshot until
+        STREAMBATCH urls are queued or it has been read through. Must be
+        called with the lock held.
+        :return: the number of urls enqueued.
+        """
+        added = 0
+        while self.queued < self.stream_batch and self.journal.unread_pending:
+            for fingerprint, entry in self.journal.read_pending(self.stream_batch):
+                # Urls of the log are also in the snapshot after a crash
+                # during compaction.
+                if fingerprint not in self.pending and self._admit_pending(
+                        fingerprint, entry):
+                    added += 1
+        return added
+
+    def _enqueue(self, url, priority):
+        """
+        Adds a url to the queue of its host, scheduling the host if it had
+        nothing pending. Must be called with the lock held.
+        :param url: the url to enqueue.
+        :param priority: its score, lower is downloaded sooner.
+        :return: None
+        """
+        host = canonicalize(url).host
+        entry = (priority, next(self.order), url)
+        self.queued += 1
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = [entry]
+            ready_at = self.next_fetch.get(host, 0.0)
+            if ready_at <= time.monotonic():
+                self._make_ready(host)
+            else:
+                heappush(self.host_heap, (ready_at, host))
+        else:
+            heappush(queue, entry)
+            if host in self.ready_keys and queue[0] is entry:
+                # The new url is now the host's best.
+                self._make_ready(host)
+        self.has_work.notify()
+
+    def _make_ready(self, host):
+        """
+        Moves a host with pending urls to the ready heap, keyed by the score
+        of its best url plus its host penalty. Must be called with the lock
+        held.
+        """
+        key = self.host_queues[host][0][0] + self.scorer.host_penalty(
+            self.host_fetched.get(host, 0))
+        self.ready_keys[host] = key
+        heappush(self.ready_heap, (key, host))
+
+    def get_tbd_url(self):
+        """
+        Gets the next url whose host may be fetched from without breaking
+        politeness. Blocks while every pending host is still cooling down, or
+        while the frontier is empty but other workers may still add links.
+        :return: the url to download, or None once the crawl is over.
+        """
+        with self.has_work:
+            while True:
+                if self.queued < self.stream_batch:
+                    self._stream_pending()
+                now = time.monotonic()
+                while self.host_heap and self.host_heap[0][0] <= now:
+                    host = heappop(self.host_heap)[1]
+                    if self.next_fetch.get(host, 0.0) > now:
+                        # Delayed by put_back since it was pushed.
+                        heappush(self.host_heap, (self.next_fetch[host], host))
+                    else:
+                        self._make_ready(host)
+                while self.ready_heap:
+                    key, host = heappop(self.ready_heap)
+                    if self.ready_keys.get(host) != key:
+                        # Superseded by a better url of the host.
+                        continue
+                    del self.ready_keys[host]
+                    if self.next_fetch.get(host, 0.0) > now:
+                        # Its turn was taken since it was made ready.
+                        heappush(self.host_heap, (self.next_fetch[host], host))
+                        continue
+                    queue = self.host_queues[host]
+                    url = heappop(queue)[2]
+                    self.queued -= 1
+                    self.host_fetched[host] = self.host_fetched.get(host, 0) + 1
+                    self.next_fetch[host] = now + self._delay(host)
+                    if queue:
+                        heappush(self.host_heap, (self.next_fetch[host], host))
+                    else:
+                        del self.host_queues[host]
+                    self.in_progress += 1
+                    return url
+                if self.host_heap:
+                    self.has_work.wait(self.host_heap[0][0] - now)
+                    continue
+                if not self.in_progress:
+                    # Nothing pending and nothing that can add more links.
+                    self.has_work.notify_all()
+                    return None
+                self.has_work.wait()
+
+    def put_back(self, url):
+        """
+        Puts back a url handed out by get_tbd_url without downloading it,
+        when another request to its host, like its robots.txt, took the
+        host's turn. The host is not fetched from again before its
+        politeness delay has passed.
+        :param url: the url to put back.
+        :return: None
+        """
+        host = canonicalize(url).host
+        with self.lock:
+            entry = self.pending.get(url_fingerprint(url))
+            self.next_fetch[host] = time.monotonic() + self._delay(host)
+            self._enqueue(url, 0.0 if entry is None else entry[2])
+            if self.in_progress:
+                self.in_progress -= 1
+
+    def take_turn(self, host):
+        """
+        Waits for the politeness delay of a host to pass and takes its turn,
+        for a request to the host that is not one of the frontier's urls,
+        like one of its sitemaps. end_turn is called once it is done.
+        :param host: the host.
+        :return: None
+        """
+        host = host.lower()
+        with self.has_work:
+            while True:
+                now = time.monotonic()
+                ready_at = self.next_fetch.get(host, 0.0)
+                if ready_at <= now:
+                    break
+                self.has_work.wait(ready_at - now)
+            self.next_fetch[host] = now + self._delay(host)
+
+    def end_turn(self, host):
+        """
+        Ends a turn taken with take_turn. The host is not fetched from again
+        before its politeness delay has passed.
+        :param host: the host.
+        :return: None
+        """
+        host = host.lower()
+        with self.lock:
+            self.next_fetch[host] = time.monotonic() + self._delay(host)
+
+    def _delay(self, host):
+        """
+        :return: the politeness delay of a host, in seconds.
+        """
+        return self.host_delays.get(host, self.config.time_delay)
+
+    def set_host_delay(self, host, delay):
+        """
+        Sets the politeness delay of a host, when it asks for more than the
+        configured POLITENESS.
+        :param host: the host.
+        :param delay: the delay between two downloads, in seconds.
+        :return: None
+        """
+        with self.lock:
+            if delay > self.config.time_delay:
+                self.host_delays[host.lower()] = delay
+
+    def depth_of(self, parent):
+        """
+        :param parent: the url a link was found on, or None.
+        :return: the depth of the link, one more than its pending parent's,
+            or 0 without one.
+        """
+        if parent is None:
+            return 0
+        with self.lock:
+            entry = self.pending.get(url_fingerprint(parent))
+        return 0 if entry is None else entry[1] + 1
+
+    def add_url(self, url, parent=None, depth=None, sitemap_priority=None):
+        """
+        Adds a url to be downloaded, unless it was seen before.
+        :param url: the url to add.
+        :param parent: the url it was found on, if any.
+        :param depth: the depth of the url, when its parent is not known to
+            this frontier. By default it is taken from the parent.
+        :param sitemap_priority: its priority in a sitemap, if it was read
+            from one, passed on to the scorer.
+        :return: True if the url is new.
+        """
+        url = canonical_url(url)
+        fingerprint = url_fingerprint(url)
+        with self.lock:
+            if not self.seen.add_fingerprint(fingerprint):
+                return False
+            if depth is None:
+                depth = self.depth_of(parent)
+            priority = self.scorer.score(url, depth, sitemap_priority)
+            self.pending[fingerprint] = (url, depth, priority)
+            self.journal.record_add(url, depth, priority)
+            self._enqueue(url, priority)
+            return True
+
+    def add_urls(self, urls, parent=None, sitemap_priorities=None):
+        """
+        Adds many urls at once, in order, holding the lock throughout.
+        :param urls: an iterable of urls.
+        :param parent: the url they were found on, if any.
+        :param sitemap_priorities: an iterable of their sitemap priorities,
+            in the same order, if they were read from a sitemap.
+        :return: the list of the new urls.
+        """
+        added = list()
+        if sitemap_priorities is None:
+            sitemap_priorities = repeat(None)
+        with self.lock:
+            for url, sitemap_priority in zip(urls, sitemap_priorities):
+                if self.add_url(url, parent, sitemap_priority=sitemap_priority):
+                    added.append(url)
+        return added
+
+    def mark_url_complete(self, url):
+        fingerprint = url_fingerprint(url)
+        with self.lock:
+            if not self.seen.contains_fingerprint(fingerprint):
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.pending.pop(fingerprint, None)
+            self.journal.record_complete(url)
+            # The live urls include those still unread in the snapshot, or
+            # every few records after a restart would rewrite all of them.
+            if self.journal.needs_compaction(
+                    len(self.pending) + self.journal.unread_pending):
+                self.journal.compact(self.seen, self.pending)
+            if self.in_progress:
+                self.in_progress -= 1
+            self.has_work.notify_all()
+
+    def close(self):
+        """
+        Flushes any buffered progress to the save file.
+        :return: None
+        """
+        with self.lock:
+            self.journal.close()
@@ -0,0 +1,334 @@
+import atexit
+import mmap
+import os
+import shutil
+import struct
+
+from threading import Thread, Lock, Event
+
+from utils.seen import url_fingerprint
+
+
+class PendingSnapshot(object):
+    """
+    The urls still to be downloaded when the journal was last compacted, in
+    a file of fixed width records indexing a heap of utf-8 urls:
+        header: MAGIC, the number of records
+        records: (fingerprint, priority, depth, url length, url offset)
+        heap: the urls, back to back, at offsets from the end of the records
+    The file is memory mapped and read from a cursor, so opening it reads
+    nothing but the header, and only the records read are ever decoded.
+    """
+    MAGIC = b"FRPEND01"
+    HEADER = struct.Struct("<8sQ")
+    RECORD = struct.Struct("<QdIIQ")
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.count = 0
+        self.heap_offset = 0
+        self.cursor = 0
+
+    def open(self, cursor=0):
+        """
+        Maps the snapshot file, if there is one.
+        :param cursor: the index of the first record to read.
+        :return: None
+        """
+        self.close()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.HEADER.size:
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.count = self.HEADER.unpack_from(self.map, 0)
+            if magic != self.MAGIC:
+                self.close()
+                raise ValueError(f"{self.path} is not a frontier snapshot")
+            self.heap_offset = self.HEADER.size + self.count * self.RECORD.size
+        self.cursor = min(cursor, self.count)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.file, self.map, self.count, self.cursor = None, None, 0, 0
+
+    @property
+    def remaining(self):
+        """
+        The number of records not read yet.
+        """
+        return self.count - self.cursor
+
+    def _record(self, index):
+        """
+        :return: (fingerprint, priority, depth, url as bytes) of a record.
+        """
+        fingerprint, priority, depth, length, offset = self.RECORD.unpack_from(
+            self.map, self.HEADER.size + index * self.RECORD.size)
+        start = self.heap_offset + offset
+        return fingerprint, priority, depth, self.map[start:start + length]
+
+    def read(self, count):
+        """
+        Reads records from the cursor on.
+        :param count: the most records to read.
+        :return: a list of (fingerprint, (url, depth, priority)).
+        """
+        end = min(self.cursor + count, self.count)
+        records = list()
+        for index in range(self.cursor, end):
+            fingerprint, priority, depth, url = self._record(index)
+            records.append((fingerprint, (url.decode("utf-8"), depth, priority)))
+        self.cursor = end
+        return records
+
+    def unread(self):
+        """
+        :return: an iterator of (fingerprint, url as bytes, depth, priority)
+            over the records not read yet, without decoding the urls.
+        """
+        for index in range(self.cursor, self.count):
+            fingerprint, priority, depth, url = self._record(index)
+            yield fingerprint, url, depth, priority
+
+    @classmethod
+    def write(cls, path, entries):
+        """
+        Writes a snapshot to a temporary file next to path. The records are
+        written straight to it and the urls to a second file, appended once
+        the number of records is known, so memory use does not grow with
+        the number of urls.
+        :param path: the path of the snapshot.
+        :param entries: an iterable of (fingerprint, url as bytes, depth,
+            priority).
+        :return: the path of the temporary file, to be renamed to path.
+        """
+        temp_path = f"{path}.tmp"
+        heap_path = f"{path}.heap"
+        count = offset = 0
+        with open(temp_path, "wb") as outfile, open(heap_path, "w+b") as heap:
+            outfile.write(cls.HEADER.pack(cls.MAGIC, 0))
+            for fingerprint, url, depth, priority in entries:
+                outfile.write(cls.RECORD.pack(fingerprint, priority, depth, len(url), offset))
+                heap.write(url)
+                offset += len(url)
+                count += 1
+            heap.seek(0)
+            shutil.copyfileobj(heap, outfile)
+            outfile.seek(0)
+            outfile.write(cls.HEADER.pack(cls.MAGIC, count))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.remove(heap_path)
+        return temp_path
+
+
+class FrontierJournal(object):
+    """
+    Append-only log of frontier events.
+    Every discovered url is written as an "A" record, with its depth and
+    priority, and every completed url as a "C" record, one per line.
+    Records are buffered and group committed to disk once the batch is full
+    or the flush interval has passed, so a crash loses at most one batch.
+    The log is periodically compacted: the seen set of all known urls is
+    saved next to it as <path>.seen, the urls still to be downloaded as a
+    PendingSnapshot in <path>.pending, and the log is emptied.
+    On restart, only the log written since the last compaction is replayed.
+    The urls of the snapshot are read in batches with read_pending, as the
+    frontier needs them.
+    """
+    ADD = "A"
+    COMPLETE = "C"
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500,
+                 compact_ratio=4.0, min_compact_records=10000):
+        self.path = path
+        self.seen_path = f"{path}.seen"
+        self.snapshot = PendingSnapshot(f"{path}.pending")
+        # Fingerprints of snapshot urls completed since the last compaction.
+        self.completed = set()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+
+        self.lock = Lock()
+        self.buffer = list()
+        self.records = 0
+        self.file = None
+        self.closed = Event()
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        atexit.register(self.close)
+
+    def remove(self):
+        """
+        Deletes the log and its seen set and pending url snapshots.
+        :return: None
+        """
+        self.snapshot.close()
+        for path in (self.path, self.seen_path, self.snapshot.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self, seen):
+        """
+        Replays the log into the frontier state, then opens it for appending.
+        A torn record at the end of the file (from a crash mid-write) is
+        ignored. The pending url snapshot is only mapped, not read.
+        :param seen: the empty seen set, filled with every known url.
+        :return: a dict of url fingerprint -> (url, depth, priority) of the
+            urls added to the log and still to be downloaded. Those of the
+            snapshot are left to read_pending.
+        """
+        pending = dict()
+        if os.path.exists(self.seen_path):
+            seen.read(self.seen_path)
+        self.snapshot.open()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as infile:
+                for line in infile:
+                    if not line.endswith("\n"):
+                        break
+                    kind, entry = line[0], self._parse_entry(line[2:-1])
+                    fingerprint = url_fingerprint(entry[0])
+                    seen.add_fingerprint(fingerprint)
+                    if kind == self.ADD:
+                        pending.setdefault(fingerprint, entry)
+                    elif kind == self.COMPLETE:
+                        if pending.pop(fingerprint, None) is None:
+                            self.completed.add(fingerprint)
+                    self.records += 1
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.flusher.start()
+        return pending
+
+    def read_pending(self, count):
+        """
+        Reads the next urls of the pending url snapshot, skipping those
+        completed since it was written.
+        :param count: the most snapshot records to read.
+        :return: a list of (fingerprint, (url, depth, priority)).
+        """
+        with self.lock:
+            return [(fingerprint, entry) for fingerprint, entry in self.snapshot.read(count)
+                    if fingerprint not in self.completed]
+
+    @property
+    def unread_pending(self):
+        """
+        The number of snapshot urls not read yet.
+        """
+        return self.snapshot.remaining
+
+    @staticmethod
+    def _parse_entry(record):
+        """
+        Parses the body of a record. Records written before urls had a
+        priority hold only the url, and get depth 0 and priority 0.
+        :return: (url, depth, priority).
+        """
+        fields = record.split("\t", 2)
+        if len(fields) < 3:
+            return record, 0, 0.0
+        return fields[2], int(fields[0]), float(fields[1])
+
+    @classmethod
+    def _format_add(cls, url, depth, priority):
+        return f"{cls.ADD}\t{depth}\t{priority!r}\t{url}\n"
+
+    def record_add(self, url, depth=0, priority=0.0):
+        self._append(self._format_add(url, depth, priority))
+
+    def record_complete(self, url):
+        self._append(f"{self.COMPLETE}\t{url}\n")
+
+    def _append(self, record):
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """
+        Writes the pending batch and syncs it to disk.
+        Must be called with the lock held.
+        """
+        if not self.buffer or self.file is None:
+            return
+        self.file.write("".join(self.buffer))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records += len(self.buffer)
+        self.buffer.clear()
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def needs_compaction(self, live_count):
+        """
+        Checks whether the log has grown enough past the number of live urls
+        to be worth rewriting.
+        :param live_count: the number of urls still to be downloaded.
+        :return: True if compact should be called.
+        """
+        return (self.records >= self.min_compact_records
+                and self.records > self.compact_ratio * live_count)
+
+    def compact(self, seen, pending):
+        """
+        Saves the seen set, writes a new pending url snapshot and empties
+        the log, in that order. The new snapshot holds the pending urls
+        read into the frontier, best first, then the urls of the old one not
+        read yet, copied without decoding them. Reading resumes after the
+        first ones. A crash before the log is emptied leaves urls both in
+        the snapshot and the log, which the frontier skips when it reads
+        them from the snapshot.
+        :param seen: the seen set of every known url.
+        :param pending: the dict of url fingerprint -> (url, depth,
+            priority) of the urls read into the frontier and still to be
+            downloaded.
+        :return: None
+        """
+        with self.lock:
+            self._flush()
+            seen.save(self.seen_path)
+            temp_path = PendingSnapshot.write(
+                self.snapshot.path, self._snapshot_entries(pending))
+            # The old snapshot is unmapped first, as a mapped file cannot be
+            # replaced on every platform.
+            self.snapshot.close()
+            os.replace(temp_path, self.snapshot.path)
+            self.snapshot.open(cursor=len(pending))
+            self.completed.clear()
+            self.file.close()
+            self.file = open(self.path, "w", encoding="utf-8")
+            self.records = 0
+
+    def _snapshot_entries(self, pending):
+        """
+        :return: an iterator of the records of a new snapshot, see compact.
+        """
+        for fingerprint, (url, depth, priority) in sorted(
+                pending.items(), key=lambda item: item[1][2]):
+            yield fingerprint, url.encode("utf-8"), depth, priority
+        for fingerprint, url, depth, priority in self.snapshot.unread():
+            if fingerprint not in self.completed and fingerprint not in pending:
+                yield fingerprint, url, depth, priority
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        with self.lock:
+            self._flush()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.snapshot.close()
@@ -0,0 +1,75 @@
+import multiprocessing
+
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore
+
+from utils.page import parse_content
+
+# What the worker needs from a parsed page.
+#   links: the href of every <a> tag, as written in the page.
+#   word_counts: a Counter of the lowercased tokens of the page.
+#   token_count: the number of tokens on the page.
+ParsedPage = namedtuple("ParsedPage", ["links", "word_counts", "token_count"])
+
+
+def count_page(page):
+    """
+    Reduces a utils.page.Page to what the worker needs.
+    :param page: the parsed page.
+    :return: a ParsedPage.
+    """
+    return ParsedPage(
+        page.links, Counter(token.lower() for token in page.tokens),
+        len(page.tokens))
+
+
+def parse_and_count(content):
+    """
+    Parses and tokenizes the content of a page. Runs in a pool process.
+    :param content: the raw bytes of the page.
+    :return: a ParsedPage.
+    """
+    return count_page(parse_content(content))
+
+
+class ParsePool(object):
+    """
+    Runs the CPU bound parsing and tokenizing of pages in separate processes,
+    so the download threads are not held back by the GIL.
+    At most max_pending pages are queued at once. Threads handing in more
+    pages block until the pool catches up.
+    """
+
+    def __init__(self, processes, max_pending):
+        # Workers are already running when the pool starts its processes, so
+        # spawn them rather than fork the threaded parent.
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"))
+        self.slots = BoundedSemaphore(max_pending)
+
+    def submit(self, content):
+        """
+        Queues a page for parsing, blocking while the queue is full.
+        :param content: the raw bytes of the page.
+        :return: a Future of the ParsedPage.
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(parse_and_count, content)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def parse(self, content):
+        """
+        Parses a page in the pool and waits for the result.
+        :param content: the raw bytes of the page.
+        :return: a ParsedPage.
+        """
+        return self.submit(content).result()
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,71 @@
+import math
+
+from utils.canonical import canonicalize
+
+
+class UrlScorer(object):
+    """
+    Decides the order the frontier downloads urls in. Lower scores are
+    downloaded first.
+    A url is scored once, when it is added, from:
+      - its depth, the number of links followed from a seed or sitemap,
+      - its novelty, falling as more links of its path template are found,
+      - its trap risk, from the share of its template's pages that repeated
+        content, or from path segments repeating like a calendar or a
+        relative link loop,
+      - its sitemap priority, for urls read from a sitemap.
+    Host fairness is applied when choosing between hosts instead, as a
+    penalty growing with the number of pages already fetched from the host,
+    so that a large host cannot crowd out the others.
+    Any object with score and host_penalty methods can be passed to the
+    Frontier instead, to crawl in another order.
+    """
+
+    def __init__(self, config, trap_detector=None):
+        self.depth_weight = config.depth_weight
+        self.host_weight = config.host_weight
+        self.novelty_weight = config.novelty_weight
+        self.trap_weight = config.trap_weight
+        self.sitemap_weight = config.sitemap_weight
+        self.trap_detector = trap_detector
+
+    @staticmethod
+    def path_risk(url):
+        """
+        :return: the share of the url's path segments that repeat an
+            earlier segment, between 0 and 1.
+        """
+        parts = canonicalize(url)
+        if parts is None:
+            return 0.0
+        segments = [segment for segment in parts.path.split("/") if segment]
+        if len(segments) < 2:
+            return 0.0
+        return 1.0 - len(set(segments)) / len(segments)
+
+    def score(self, url, depth, sitemap_priority=None):
+        """
+        Scores a url as it is added to the frontier.
+        :param url: the url.
+        :param depth: its depth, 0 for seeds.
+        :param sitemap_priority: its priority between 0 and 1 in a sitemap,
+            None if it was not read from one.
+        :return: the score, lower is downloaded sooner.
+        """
+        novelty, risk = 1.0, 0.0
+        if self.trap_detector is not None:
+            novelty, risk = self.trap_detector.assess(url)
+        risk = max(risk, self.path_risk(url))
+        score = (self.depth_weight * depth
+                 + self.novelty_weight * (1.0 - novelty)
+                 + self.trap_weight * risk)
+        if sitemap_priority is not None:
+            score += self.sitemap_weight * (1.0 - sitemap_priority)
+        return score
+
+    def host_penalty(self, fetched):
+        """
+        :param fetched: the number of pages fetched from a host so far.
+        :return: the amount added to the score of the host's best url.
+        """
+        return self.host_weight * math.log1p(fetched)
@@ -0,0 +1,454 @@
+import time
+
+from bisect import bisect
+from hashlib import blake2b
+from itertools import islice
+from multiprocessing.connection import Listener, Client
+from threading import Thread, Lock, Condition, Event
+
+from utils import get_logger
+from utils.canonical import canonicalize, canonical_url
+from utils.seen import url_fingerprint
+from crawler.frontier import Frontier
+from Results import Results, MERGE_BATCH
+from utils.word_counts import WordCounter
+
+# Messages between shards, sent as tuples starting with their kind.
+#   (URLS, [(url, depth), ...]): urls owned by the receiver.
+#   (POLL, round): asks for a STATUS, sent by the coordinator.
+#   (STATUS, round, shard, idle, sent, received): the answer to a POLL.
+#   (DONE,): the whole crawl is over, sent by the coordinator.
+#   (WORDS, shard, [(word, count), ...]): a batch of the word counts of a
+#       shard, sent to the coordinator before its RESULTS.
+#   (RESULTS, shard, counts): the other Results counts of a shard, sent to
+#       the coordinator once its workers are done.
+URLS, POLL, STATUS, DONE, WORDS, RESULTS = (
+    "urls", "poll", "status", "done", "words", "results")
+COORDINATOR = 0
+
+
+def _ring_hash(key):
+    return int.from_bytes(
+        blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashRing(object):
+    """
+    Consistent hashing of hosts onto shards. Every shard is placed at
+    replicas points of a ring, and a host belongs to the first shard point
+    after its own hash. Changing the number of shards only moves the hosts
+    next to the points that were added or removed.
+    """
+
+    def __init__(self, shard_count, replicas=64):
+        points = sorted(
+            (_ring_hash(f"{shard}:{replica}"), shard)
+            for shard in range(shard_count) for replica in range(replicas))
+        self.keys = [key for key, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def owner(self, host):
+        """
+        :param host: the host, as in the netloc of a url.
+        :return: the id of the shard that crawls it.
+        """
+        index = bisect(self.keys, _ring_hash(host.lower()))
+        return self.shards[index % len(self.shards)]
+
+
+class ShardNode(object):
+    """
+    Connects a shard to the others, which all listen at the addresses listed
+    in SHARDS. Urls for other shards are buffered per shard and sent in
+    batches of FORWARDBATCH, or every FORWARDINTERVAL seconds. Batches are
+    only sent by the flusher thread, or by a worker with nothing to do, so
+    a thread holding the frontier lock never waits on the network.
+    The coordinator, shard 0, detects the end of the crawl: it polls every
+    shard for whether it is idle and how many urls it has sent and received.
+    Once two polls in a row find every shard idle, with as many urls
+    received as sent and no change in between, no url is in flight and none
+    can be produced, so it tells every shard the crawl is done.
+    """
+
+    def __init__(self, config, frontier):
+        self.config = config
+        self.frontier = frontier
+        self.logger = get_logger(f"SHARD-{config.shard_id}", "SHARD")
+        self.shard_id = config.shard_id
+        self.addresses = config.shards
+        self.authkey = config.user_agent.encode("utf-8")
+        self.batch_size = config.forward_batch
+        self.interval = config.forward_interval
+
+        self.lock = Lock()
+        self.outboxes = {shard: list() for shard in range(len(self.addresses))}
+        self.connections = dict()
+        self.connection_locks = {shard: Lock() for shard in self.outboxes}
+        self.sent = 0
+        self.received = 0
+        # Urls taken from an outbox but not sent yet.
+        self.sending = 0
+        self.done = Event()
+        self.closed = Event()
+        self.batch_ready = Event()
+
+        # Filled by the coordinator from the messages of the other shards.
+        self.replies = Condition()
+        self.statuses = dict()
+        self.shard_results = dict()
+        # The words of the other shards, spilled like those of any Results.
+        self.shard_words = WordCounter(config.spill_words, config.spill_directory)
+
+        host, port = self.addresses[self.shard_id]
+        self.listener = Listener((host, port), authkey=self.authkey)
+        self.threads = [Thread(target=self._accept, daemon=True),
+                        Thread(target=self._flush_periodically, daemon=True)]
+        if self.shard_id == COORDINATOR:
+            self.threads.append(Thread(target=self._coordinate, daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _connection(self, shard):
+        """
+        Gets the connection to a shard, connecting on first use and retrying
+        while the shard is still starting. Must be called with the shard's
+        connection lock held.
+        """
+        connection = self.connections.get(shard)
+        while connection is None:
+            try:
+                connection = Client(self.addresses[shard], authkey=self.authkey)
+            except OSError:
+                if self.closed.wait(self.interval):
+                    raise
+                continue
+            self.connections[shard] = connection
+        return connection
+
+    def send(self, shard, message):
+        """
+        Sends a message to a shard.
+        :return: True if it was sent.
+        """
+        with self.connection_locks[shard]:
+            try:
+                self._connection(shard).send(message)
+                return True
+            except (OSError, EOFError):
+                self.logger.exception(f"Failed to send to shard {shard}.")
+                connection = self.connections.pop(shard, None)
+                if connection is not None:
+                    connection.close()
+                return False
+
+    def forward(self, url, depth):
+        """
+        Buffers a url for the shard that owns it.
+        :param url: the url.
+        :param depth: its depth in this shard's crawl.
+        :return: None
+        """
+        shard = self.frontier.ring.owner(canonicalize(url).host)
+        with self.lock:
+            outbox = self.outboxes[shard]
+            outbox.append((url, depth))
+            if len(outbox) >= self.batch_size:
+                self.batch_ready.set()
+
+    def flush(self):
+        """
+        Sends every buffered url. Batches that fail to send are put back to
+        be sent on the next flush.
+        :return: None
+        """
+        with self.lock:
+            batches = [(shard, outbox) for shard, outbox in self.outboxes.items() if outbox]
+            for shard, batch in batches:
+                self.outboxes[shard] = list()
+                self.sending += len(batch)
+        for shard, batch in batches:
+            sent = self.send(shard, (URLS, batch))
+            with self.lock:
+                self.sending -= len(batch)
+                if sent:
+                    self.sent += len(batch)
+                else:
+                    self.outboxes[shard][:0] = batch
+
+    def _flush_periodically(self):
+        while not self.closed.is_set():
+            self.batch_ready.wait(self.interval)
+            self.batch_ready.clear()
+            self.flush()
+
+    def is_idle(self):
+        """
+        :return: True if this shard has nothing to download, nothing being
+            downloaded and nothing left to send.
+        """
+        with self.lock:
+            if self.sending or any(self.outboxes.values()):
+                return False
+        return self.frontier.is_idle()
+
+    def _status(self):
+        idle = self.is_idle()
+        with self.lock:
+            return idle, self.sent, self.received
+
+    def _accept(self):
+        while not self.closed.is_set():
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError):
+                if self.closed.is_set():
+                    return
+                self.logger.exception("Failed to accept a shard connection.")
+                continue
+            Thread(target=self._receive, args=(connection,), daemon=True).start()
+
+    def _receive(self, connection):
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except (OSError, EOFError):
+                    return
+                self._handle(message)
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == URLS:
+            self.frontier.adopt(message[1])
+            with self.lock:
+                self.received += len(message[1])
+        elif kind == POLL:
+            self.send(COORDINATOR, (STATUS, message[1], self.shard_id) + self._status())
+        elif kind == STATUS:
+            with self.replies:
+                self.statuses[message[2]] = message
+                self.replies.notify_all()
+        elif kind == DONE:
+            self.finish()
+        elif kind == WORDS:
+            with self.replies:
+                spill = self.shard_words.update(dict(message[2]))
+            if spill:
+                self.shard_words.spill()
+        elif kind == RESULTS:
+            with self.replies:
+                self.shard_results[message[1]] = message[2]
+                self.replies.notify_all()
+
+    def _poll(self, poll_round):
+        """
+        Polls every shard for its status.
+        :return: a list of (idle, sent, received) per shard, or None if a
+            shard did not answer in time.
+        """
+        with self.replies:
+            self.statuses.clear()
+        for shard in range(len(self.addresses)):
+            if shard != self.shard_id:
+                self.send(shard, (POLL, poll_round))
+        statuses = [self._status()]
+        deadline = time.monotonic() + 10 * self.interval
+        with self.replies:
+            while len(self.statuses) < len(self.addresses) - 1:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.done.is_set():
+                    return None
+                self.replies.wait(remaining)
+            for status in self.statuses.values():
+                if status[1] == poll_round:
+                    statuses.append(status[3:])
+        if len(statuses) < len(self.addresses):
+            return None
+        return statuses
+
+    def _coordinate(self):
+        previous = None
+        poll_round = 0
+        while not self.closed.wait(self.interval) and not self.done.is_set():
+            poll_round += 1
+            statuses = self._poll(poll_round)
+            if statuses is None:
+                previous = None
+                continue
+            totals = (sum(status[1] for status in statuses),
+                      sum(status[2] for status in statuses))
+            quiet = all(status[0] for status in statuses) and totals[0] == totals[1]
+            if quiet and totals == previous:
+                self.logger.info(
+                    f"Every shard is idle after forwarding {totals[0]} urls, "
+                    f"ending the crawl.")
+                for shard in range(len(self.addresses)):
+                    if shard != self.shard_id:
+                        self.send(shard, (DONE,))
+                self.finish()
+                return
+            previous = totals if quiet else None
+
+    def finish(self):
+        """
+        Marks the whole crawl as done and wakes the workers waiting for urls.
+        :return: None
+        """
+        self.done.set()
+        with self.frontier.has_work:
+            self.frontier.has_work.notify_all()
+
+    def gather_results(self, results):
+        """
+        Merges the Results of every shard on the coordinator, which writes
+        the reports of the whole crawl. Other shards send their counts to the
+        coordinator, the words in batches.
+        :param results: the merged Results of this shard's workers.
+        :return: None
+        """
+        if self.shard_id != COORDINATOR:
+            counts = results.export_counts()
+            words = counts.pop("words")
+            while True:
+                batch = list(islice(words, MERGE_BATCH))
+                if not batch:
+                    break
+                self.send(COORDINATOR, (WORDS, self.shard_id, batch))
+            self.send(COORDINATOR, (RESULTS, self.shard_id, counts))
+            return
+        timeout = 60 * self.interval
+        deadline = time.monotonic() + timeout
+        with self.replies:
+            while len(self.shard_results) < len(self.addresses) - 1:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.error(
+                        f"Only {len(self.shard_results)} shards sent their "
+                        f"results after {timeout} seconds, reporting without "
+                        f"the others.")
+                    break
+                self.replies.wait(remaining)
+            for counts in self.shard_results.values():
+                results.merge_counts(dict(counts, words=()))
+            words = self.shard_words.snapshot()
+        results.merge_words(words.stream())
+        results.write_reports()
+
+    def close(self):
+        self.flush()
+        self.closed.set()
+        self.batch_ready.set()
+        self.listener.close()
+        for shard, connection in list(self.connections.items()):
+            with self.connection_locks[shard]:
+                connection.close()
+        self.connections.clear()
+
+
+class ShardedFrontier(Frontier):
+    """
+    Frontier of one shard of a distributed crawl. The hosts are split
+    between the shards by a HashRing, and each shard only downloads from its
+    own hosts. Urls of other hosts are forwarded to their shard, which
+    counts them as unique pages if they are new to it.
+    The shard's urls are journaled as usual. A url forwarded to another
+    shard is remembered in this shard's seen set, so it is forwarded only
+    once. Forwarded urls still buffered when a shard crashes are lost, at
+    most one batch per shard.
+    """
+
+    def __init__(self, config, restart, scorer=None):
+        self.ring = HashRing(len(config.shards))
+        self.shard_id = config.shard_id
+        self.adopted = list()
+        self.node = ShardNode(config, self)
+        super().__init__(config, restart, scorer)
+        self.node.start()
+
+    def owns(self, url):
+        return self.ring.owner(canonicalize(url).host) == self.shard_id
+
+    def _admit_pending(self, fingerprint, entry):
+        # Hand over the urls of hosts that moved to another shard since the
+        # save file was written, as when the number of shards changed.
+        url, depth, _ = entry
+        if not self.owns(url):
+            self.journal.record_complete(url)
+            self.node.forward(url, depth)
+            return False
+        return super()._admit_pending(fingerprint, entry)
+
+    def add_url(self, url, parent=None, depth=None, sitemap_priority=None):
+        if self.owns(url):
+            return super().add_url(url, parent, depth, sitemap_priority)
+        url = canonical_url(url)
+        with self.lock:
+            if not self.seen.add_fingerprint(url_fingerprint(url)):
+                return False
+            if depth is None:
+                depth = self.depth_of(parent)
+        self.node.forward(url, depth)
+        return False
+
+    def adopt(self, urls):
+        """
+        Adds the urls forwarded by another shard.
+        :param urls: a list of (url, depth).
+        :return: None
+        """
+        with self.lock:
+            for url, depth in urls:
+                if self.add_url(url, depth=depth):
+                    self.adopted.append(url)
+
+    def take_adopted(self):
+        """
+        :return: the new urls forwarded by other shards since the last call,
+            to be counted as unique pages.
+        """
+        with self.lock:
+            adopted, self.adopted = self.adopted, list()
+        return adopted
+
+    def is_idle(self):
+        with self.lock:
+            return (not self.host_queues and not self.in_progress
+                    and not self.journal.unread_pending)
+
+    def get_tbd_url(self):
+        """
+        Gets the next url of this shard. While this shard has nothing to
+        download, waits for urls from the others until the coordinator ends
+        the whole crawl.
+        :return: the url to download, or None once the crawl is over.
+        """
+        while True:
+            url = super().get_tbd_url()
+            if url is not None or self.node.done.is_set():
+                return url
+            self.node.flush()
+            with self.has_work:
+                if not self.host_queues and not self.node.done.is_set():
+                    self.has_work.wait(self.node.interval)
+
+    def merge_results(self, results):
+        """
+        Merges the Results of this shard's workers with those of the other
+        shards, see ShardNode.gather_results.
+        :param results: the Results of this shard's workers.
+        :return: None
+        """
+        merged = Results(
+            report_top_words=self.config.report_top_words,
+            report_top_subdomains=self.config.report_top_subdomains,
+            checkpointed=False, max_words=self.config.spill_words,
+            spill_directory=self.config.spill_directory)
+        for worker_results in results:
+            merged.merge_counts(worker_results.export_counts())
+        self.node.gather_results(merged)
+
+    def close(self):
+        self.node.close()
+        super().close()
@@ -2,37 +2,38 @@ from threading import Thread
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
-from Results import Results
+from utils.metrics import METRICS
+from utils.canonical import canonical_url
+from Results import Results, ResultsDelta
 from TrapNavigator import TrapNavigator
+from TrapDetector import TrapDetector
 import scraper
-import time
-from bs4 import BeautifulSoup
-from nltk.tokenize import RegexpTokenizer
-from url_normalize import url_normalize
-
-def tokenize(response):
-    """
-    Tokenize the passed html response.
-    :param response: the web response.
-    :return:
-    """
-    tokens = []
-    if response.status == 200:
-        try:
-            soup = BeautifulSoup(response.raw_response.content, "lxml")
-            tokenizer = RegexpTokenizer(r'\w+')
-            tokens = tokenizer.tokenize(soup.get_text())
-        except AttributeError:
-            print("No content found.")
-
-    return tokens
+from utils.page import EMPTY_PAGE, Page, parse_content
+from utils.simhash import SimhashIndex, simhash
+from crawler.parse_pool import count_page
 
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, parse_pool=None,
+                 trap_detector=None, simhash_index=None, sitemap_seeder=None,
+                 content_store=None, content_gate=None, results=None,
+                 trap_navigator=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        self.parse_pool = parse_pool
+        self.trap_detector = (
+            trap_detector if trap_detector is not None else TrapDetector())
+        self.simhash_index = (
+            simhash_index if simhash_index is not None
+            else SimhashIndex(config.near_duplicate_distance))
+        self.sitemap_seeder = sitemap_seeder
+        self.content_store = content_store
+        self.content_gate = content_gate
+        # The results and trap rules of the whole crawl, shared by workers.
+        self.shared_results = results
+        self.trap_navigator = trap_navigator
+        self.results = None
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {
             -1}, "Do not use requests in scraper.py"
@@ -40,77 +41,216 @@ class Worker(Thread):
             -1}, "Do not use urllib.request in scraper.py"
         super().__init__(daemon=True)
 
-    def run(self):
-        # Initialize our classes
-        results = Results()
-        trap_navigator = TrapNavigator()
+    def admit(self, resp):
+        """
+        Gets the content of the downloaded page that should be parsed.
+        :param resp: the downloaded response.
+        :return: the bytes to parse, truncated if the content gate says so,
+            or None for anything but a 200 page that passes the gate.
+        """
+        if resp.status != 200:
+            return None
+        if self.content_gate is None:
+            return resp.content
+        return self.content_gate.admit(resp)
 
-        try:
-            results.import_subdomain_json()
-            results.import_word_json()
-            results.import_longest()
-        except FileNotFoundError:
-            print("Running for first time")
+    def parse(self, resp, content):
+        """
+        Parses and tokenizes the downloaded page, in the parse pool if the
+        crawler has one, or in this thread otherwise. The parsed page is
+        kept on the response, so the scraper does not parse it again.
+        :param resp: the downloaded response.
+        :param content: the bytes to parse, from admit.
+        :return: a crawler.parse_pool.ParsedPage.
+        """
+        if not content:
+            resp.page = EMPTY_PAGE
+            return count_page(EMPTY_PAGE)
+        if self.parse_pool is None:
+            with METRICS.timer("parse"):
+                resp.page = parse_content(content)
+            with METRICS.timer("tokenize"):
+                return count_page(resp.page)
+        # The pool parses and tokenizes at once, timed together as parse.
+        with METRICS.timer("parse"):
+            parsed = self.parse_pool.parse(content)
+        resp.page = Page(parsed.links, "", [])
+        return parsed
 
-        results.export_log()
+    def setup(self):
+        """
+        Initializes the results and trap navigator of this worker, loading
+        the results of a previous crawl if the crawler did not share any.
+        The worker counts into its own delta of the shared results.
+        :return: None
+        """
+        # Initialize our classes
+        if self.shared_results is None:
+            self.shared_results = Results(
+                self.config.checkpoint_interval, self.config.checkpoint_pages,
+                self.config.report_top_words, self.config.report_top_subdomains,
+                max_words=self.config.spill_words,
+                spill_directory=self.config.spill_directory)
+            self.shared_results.load()
+        self.results = ResultsDelta(
+            self.shared_results, self.config.merge_pages,
+            self.config.merge_interval)
+        if self.trap_navigator is None:
+            self.trap_navigator = TrapNavigator(self.config.trap_file)
 
+    def next_url(self):
+        """
+        Gets the next url to download from the frontier, skipping known traps.
+        :return: the normalized url, or None once the frontier is empty.
+        """
         while True:
+            with METRICS.timer("frontier_pop"):
+                tbd_url = self.frontier.get_tbd_url()
+            if not tbd_url:
+                self.logger.info("Frontier is empty. Stopping Crawler.")
+                return None
 
-            tbd_url = self.frontier.get_tbd_url()
-            
             # NORMALIZE URL
-            tbd_url = url_normalize(str(tbd_url))
+            tbd_url = canonical_url(str(tbd_url))
             # =============
 
-            if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                break
-            if trap_navigator.known_traps(tbd_url):
-                print("Cancelling trap.")
+            with METRICS.timer("trap_check"):
+                robots = scraper.ROBOTS
+                fetches_robots = robots is not None and not robots.cached(tbd_url)
+                trapped = (self.trap_navigator.known_traps(tbd_url)
+                           or self.trap_detector.is_blocked(tbd_url)
+                           or (robots is not None and not robots.allowed(tbd_url)))
+            if not trapped and fetches_robots:
+                # Downloading robots.txt took the host's turn, so the url
+                # waits for the next one.
+                self.frontier.put_back(tbd_url)
                 continue
-            resp = download(tbd_url, self.config, self.logger)
+            if not trapped:
+                return tbd_url
+            METRICS.count("urls_skipped", reason="trap")
+            print("Cancelling trap.")
+            # Release the url so the frontier does not wait on it.
+            self.frontier.mark_url_complete(tbd_url)
+
+    def process(self, tbd_url, resp):
+        """
+        Scrapes and tokenizes a downloaded page, records it in the results
+        and adds its links to the frontier.
+        :param tbd_url: the url that was downloaded.
+        :param resp: the response, or None if the download failed.
+        :return: None
+        """
+        try:
+            if resp is None:
+                return
             self.logger.info(
                 f"Downloaded {tbd_url}, status <{resp.status}>, "
                 f"using cache {self.config.cache_server}.")
+            METRICS.count("pages", status=resp.status)
+
+            # Skip pages that are not worth parsing before they reach the
+            # parser, the store or the results.
+            content = self.admit(resp)
+            if resp.status == 200 and resp.content:
+                METRICS.count("bytes", len(resp.content))
+
+            # Keep the page, so the results can be rebuilt without crawling.
+            if self.content_store is not None and content:
+                self.content_store.put(tbd_url, content)
 
-            scraped_urls = scraper.scraper(tbd_url, resp)
+            # Parse and tokenize the response.
+            parsed = self.parse(resp, content)
 
-            # Tokenize the response.
-            # print(tbd_url)
-            tokens = tokenize(resp)
-            # print(Simhash(tokens).value)
+            # Pages that are near duplicates of a crawled page are counted,
+            # but their links are not followed.
+            fingerprint = None
+            near = None
+            if resp.status == 200 and parsed.token_count:
+                with METRICS.timer("dedup"):
+                    fingerprint = simhash(parsed.word_counts)
+                    near = self.simhash_index.add(fingerprint)
+            if near is None:
+                with METRICS.timer("scrape"):
+                    scraped_urls = scraper.scraper(tbd_url, resp)
+            else:
+                METRICS.count("pages_near_duplicate")
+                fingerprint = near
+                scraped_urls = []
 
-            # Add each token into the stored results.
-            for token in tokens:
-                results.add_word(token.lower())
+            with METRICS.timer("results"):
+                # Add the page's word counts into the stored results.
+                self.results.add_word_counts(parsed.word_counts)
 
-            # Update the current longest page length.
-            results.update_longest_length(len(tokens), tbd_url)
+                # Update the current longest page length.
+                self.results.update_longest_length(parsed.token_count, tbd_url)
+
+            # Learn whether this kind of url keeps repeating the same content.
+            # Near duplicates share the fingerprint of the page they repeat.
+            if fingerprint is not None and self.trap_detector.record_page(
+                    tbd_url, fingerprint):
+                self.logger.info(
+                    f"Blocking trap {self.trap_detector.template(tbd_url)}.")
 
             # For each obtained url, check if each url was similar
             # than the last
-            for scraped_url in scraped_urls:
-                if not trap_navigator.known_traps(scraped_url):
-                    self.frontier.add_url(scraped_url)
-                    results.add_unique_page(scraped_url)
+            with METRICS.timer("frontier_add"):
+                for scraped_url in scraped_urls:
+                    if (not self.trap_navigator.known_traps(scraped_url)
+                            and self.trap_detector.observe(scraped_url)
+                            and self.frontier.add_url(scraped_url, tbd_url)):
+                        self.results.add_unique_page(scraped_url)
+
+            # Seed the frontier from the sitemaps of newly seen hosts, while
+            # this url still keeps the frontier from running dry.
+            if self.sitemap_seeder is not None:
+                for url in self.sitemap_seeder.run_pending():
+                    self.results.add_unique_page(url)
+        except Exception:
+            # Other workers wait on this url, so never leave it hanging.
+            self.logger.exception(f"Failed to process {tbd_url}.")
+        finally:
             self.frontier.mark_url_complete(tbd_url)
 
-            # Debugging - Print word list length and current results.
-            # print(len(results.words))
-            # results.print_longest_length()
-
-            results.print_subdomains()
-            results.print_words()
-            results.export_longest_count()
-            results.export_longest_page()
-            results.export_subdomain_json()
-            results.export_word_json()
-
-            time.sleep(self.config.time_delay)
-
-        results.print_subdomains()
-        results.print_words()
-        results.export_longest_count()
-        results.export_longest_page()
-        results.export_subdomain_json()
-        results.export_word_json()
\ No newline at end of file
+        # Debugging - Print word list length and current results.
+        # print(len(results.words))
+        # results.print_longest_length()
+
+        self.count_adopted()
+        self.results.page_done()
+
+    def count_adopted(self):
+        """
+        Counts the new urls forwarded to this shard by the other shards of a
+        distributed crawl as unique pages.
+        :return: None
+        """
+        take_adopted = getattr(self.frontier, "take_adopted", None)
+        if take_adopted is not None:
+            for url in take_adopted():
+                self.results.add_unique_page(url)
+
+    def finish(self):
+        """
+        Merges the counts of this worker into the shared results and
+        checkpoints them. The crawler writes the reports once all the
+        workers are done.
+        :return: None
+        """
+        self.count_adopted()
+        self.results.merge()
+        self.shared_results.checkpoint()
+
+    def run(self):
+        self.setup()
+        while True:
+            tbd_url = self.next_url()
+            if tbd_url is None:
+                break
+            try:
+                with METRICS.timer("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+            except Exception:
+                self.logger.exception(f"Failed to download {tbd_url}.")
+                resp = None
+            self.process(tbd_url, resp)
+        self.finish()
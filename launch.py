@@ -1,23 +1,39 @@
-from configparser import ConfigParser
-from argparse import ArgumentParser
-
-from utils.server_registration import get_cache_server
-from utils.config import Config
-from crawler import Crawler
-
-
-def main(config_file, restart):
-    cparser = ConfigParser()
-    cparser.read(config_file)
-    config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
-
-
-if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("--restart", action="store_true", default=False)
-    parser.add_argument("--config_file", type=str, default="config.ini")
-    args = parser.parse_args()
-    main(args.config_file, args.restart)
+import os
+
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from utils.server_registration import get_cache_server
+from utils.config import Config
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.sharding import ShardedFrontier
+
+
+def main(config_file, restart, shard=None, cache_server=None):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser, os.path.dirname(config_file))
+    if shard is not None:
+        config.shard_id = shard
+    if cache_server:
+        # A local stand-in for the cache server, skipping the registration.
+        host, _, port = cache_server.rpartition(":")
+        config.cache_server = (host, int(port))
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    frontier_factory = ShardedFrontier if len(config.shards) > 1 else Frontier
+    crawler = Crawler(config, restart, frontier_factory=frontier_factory)
+    crawler.start()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="The id of this shard in a distributed crawl, overrides SHARDID.")
+    parser.add_argument("--cache_server", type=str, default=None,
+                        help="host:port of a cache server to use without registering.")
+    args = parser.parse_args()
+    main(args.config_file, args.restart, args.shard, args.cache_server)
@@ -0,0 +1,148 @@
+"""
+Rebuilds the results (wordJSON.json, subdomainJSON.json, the longest page
+and the reports) from the pages saved in the content store, without
+crawling again. Use it after changing how pages are tokenized or counted.
+
+    python rebuild.py [--config_file config.ini] [--processes N]
+
+Pages are read from the store and parsed, tokenized and scraped in a pool
+of processes, a chunk of pages at a time. Unique pages are counted from the
+links of the stored pages as in the crawl: known traps are skipped, the
+links of near duplicate pages are not followed, and the trap detector
+learns from the pages in the order they were stored. The links are checked
+and deduplicated once the results of the chunks are merged, so the count
+does not depend on how the pages were split into chunks. Robots.txt rules
+are not applied, as they are not saved.
+"""
+import multiprocessing
+import os
+
+from argparse import ArgumentParser
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+from functools import partial
+from itertools import islice
+
+from utils.canonical import canonical_url
+from utils.config import Config
+from utils.content_store import read_index, read_entries
+from utils.page import Page
+from utils.response import Response
+from utils.seen import SeenSet
+from utils.simhash import simhash, SimhashIndex
+from crawler.parse_pool import parse_and_count
+from Results import Results
+from TrapNavigator import TrapNavigator
+from TrapDetector import TrapDetector
+import scraper
+
+
+def count_chunk(directory, entries):
+    """
+    Parses the pages of a chunk. Runs in a pool process.
+    :param directory: the directory of the content store.
+    :param entries: a list of StoreEntry.
+    :return: (word counts of the chunk, (token count, url) of its longest
+        page, [(url, simhash or None, extracted links)] of each page). The
+        links are not checked with is_valid, which would skip those to the
+        pages of the chunk this process already scraped.
+    """
+    words = Counter()
+    longest = (0, "")
+    pages = list()
+    for url, content in read_entries(directory, entries):
+        parsed = parse_and_count(content)
+        words.update(parsed.word_counts)
+        if parsed.token_count > longest[0]:
+            longest = (parsed.token_count, url)
+        # Extract the links as the scraper does for the worker.
+        resp = Response({"url": url, "status": 200})
+        resp.page = Page(parsed.links, "", [])
+        fingerprint = simhash(parsed.word_counts) if parsed.token_count else None
+        pages.append((url, fingerprint, scraper.extract_next_links(url, resp)))
+    return words, longest, pages
+
+
+def chunks(entries, size):
+    """
+    Groups the entries of the store, skipping urls stored more than once.
+    """
+    stored = SeenSet()
+    entries = (entry for entry in entries if stored.add(entry.url))
+    while True:
+        chunk = list(islice(entries, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rebuild(config, processes, chunk_size=64):
+    """
+    Counts the stored pages into new results.
+    :param config: the Config, with the store directory and report options.
+    :param processes: the number of parse processes.
+    :param chunk_size: the number of pages parsed per task.
+    :return: the Results.
+    """
+    results = Results(
+        config.checkpoint_interval, config.checkpoint_pages,
+        config.report_top_words, config.report_top_subdomains,
+        max_words=config.spill_words, spill_directory=config.spill_directory)
+    trap_navigator = TrapNavigator(config.trap_file)
+    trap_detector = TrapDetector()
+    near_duplicates = SimhashIndex(config.near_duplicate_distance)
+    seen = SeenSet()
+
+    count = partial(count_chunk, config.content_store)
+    executor = ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context("spawn"))
+    # Only a few chunks per process are in flight, so the store is streamed
+    # instead of read into memory at once.
+    in_flight = deque()
+    pending = chunks(read_index(config.content_store), chunk_size)
+    with executor:
+        for chunk in islice(pending, 2 * processes):
+            in_flight.append(executor.submit(count, chunk))
+        while in_flight:
+            words, longest, pages = in_flight.popleft().result()
+            for chunk in islice(pending, 1):
+                in_flight.append(executor.submit(count, chunk))
+
+            results.add_word_counts(words)
+            results.update_longest_length(*longest)
+            for url, fingerprint, links in pages:
+                near = None
+                if fingerprint is not None:
+                    near = near_duplicates.add(fingerprint)
+                    trap_detector.record_page(url, fingerprint if near is None else near)
+                if near is not None:
+                    continue
+                for link in links:
+                    if (scraper.is_valid(link)
+                            and not trap_navigator.known_traps(link)
+                            and trap_detector.observe(link)
+                            and seen.add(canonical_url(link))):
+                        results.add_unique_page(link)
+    return results
+
+
+def main(config_file, processes):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser, os.path.dirname(config_file))
+    if not config.content_store:
+        raise SystemExit("Set CONTENTSTORE in the config file to rebuild from it.")
+    results = rebuild(config, processes)
+    results.checkpoint()
+    results.write_reports()
+    print(f"Rebuilt the results of {results.unique_pages} unique pages "
+          f"from {config.content_store}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    main(args.config_file, args.processes)
@@ -1,8 +1,9 @@
 import re
-from bs4 import BeautifulSoup
 from collections import Counter
-from urllib.robotparser import RobotFileParser
-from urllib.parse import urlparse, urljoin, urldefrag
+from functools import lru_cache
+from utils.canonical import canonicalize
+from utils.page import parse_page
+from utils.seen import SeenSet
 
 DOMAIN_PATTERN = re.compile(r".*\.(ics|cs|informatics|stat)\.uci\.edu$")
 EXTENSIONS_PATTERN = re.compile(r".*.(css|js|bmp|gif|jpe?g|ico"
@@ -13,7 +14,16 @@ EXTENSIONS_PATTERN = re.compile(r".*.(css|js|bmp|gif|jpe?g|ico"
             + r"|epub|dll|cnf|tgz|sha1"
             + r"|thmx|mso|arff|rtf|jar|csv"
             + r"|rm|smil|wmv|swf|wma|zip|rar|gz|ppsx|class|odc|ova)$")
-VISITED_URLS = set()
+EMAIL_PATTERN = re.compile(r".*@(uci.edu|ics.uci.edu)")
+# Fingerprints of the downloaded urls.
+VISITED_URLS = SeenSet()
+# The utils.robots.RobotsCache the worker asks before downloading, set by the crawler.
+ROBOTS = None
+
+
+def set_robots(robots):
+    global ROBOTS
+    ROBOTS = robots
 
 
 def scraper(url, resp):
@@ -35,16 +45,25 @@ def checkForRepeatingPath(parsedUrl):
     return False
 
 def checkURLForEmail(url):
-    emailPattern = re.compile(r".*@(uci.edu|ics.uci.edu)")
-    matching = re.match(emailPattern, url)
+    # Only urls with an @ can match, skip the regex for the others.
+    matching = "@" in url and EMAIL_PATTERN.match(url)
 
     return True if matching else False
 
+@lru_cache(maxsize=4096)
+def isAllowedHost(host):
+    """
+    Checks whether a host is in one of the crawled domains. Decided once
+    per host.
+    """
+    return DOMAIN_PATTERN.match(host) is not None
+
 def removeFragmentAndQuery(url):
     """
     Removes the query and fragment section from the given url
     """
-    return urljoin(url, urlparse(url).path)
+    parts = canonicalize(url, strip_query=True)
+    return url if parts is None else parts.url
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -67,20 +86,17 @@ def extract_next_links(url, resp):
         # Add the URL to the VISITED_SET of URLs
         VISITED_URLS.add(url)
 
-        # Parse the HTML content of the website using BeautifulSoup
-        soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-
-        pageText = soup.get_text(strip = True, separator = " ")
+        # Parse the HTML content of the website. The parsed page is shared
+        # with the worker, which tokenizes its text.
+        page = parse_page(resp)
 
-        # Extract the links from the webpage while being sure to defragment the URLs
-        links = [removeFragmentAndQuery(link.get("href")) for link in soup.find_all("a")]
-
-        # Check all the scraped links and check to see if they have a netloc/domain 
-        # If they do not, then add the current URL's netloc/domain into the scraped link
-        for i in range(len(links)):
-            parsed = urlparse(links[i])
-            if not parsed.netloc and parsed.path:
-                links[i] = urljoin(url, links[i])
+        # Extract the links from the webpage, resolved against the current
+        # URL and canonicalized in a single parse, without query or fragment.
+        # Every later check reuses the parts of the canonical URL.
+        for link in page.links:
+            parsed = canonicalize(link, url, strip_query=True)
+            if parsed is not None:
+                links.append(parsed.url)
 
     return links
 
@@ -101,8 +117,17 @@ def is_valid(url):
             return False
 
         # Check if the url has http or https at the beginning
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
+        parsed = canonicalize(url)
+        if parsed is None or parsed.scheme not in ("http", "https"):
+            return False
+
+        # The regex string will account for all URLs in this form:
+        # *.ics.uci.edu/*
+        # *.cs.uci.edu/*
+        # *.informatics.uci.edu/*
+        # *.stat.uci.edu/*
+        # Overall match string is r".*\.(ics|cs|informatics|stat)\.uci\.edu$"
+        if not isAllowedHost(parsed.host):
             return False
             
         # If any argument is repeated 3 or more times, we (most likely) have detected
@@ -112,16 +137,13 @@ def is_valid(url):
 
         # This will make sure that URLs that download files are not 
         # considered to be valid (anything ending with .extension)
-        if re.match(EXTENSIONS_PATTERN, parsed.path.lower()):
+        if EXTENSIONS_PATTERN.match(parsed.path.lower()):
             return False
-        
-        # The regex string will account for all URLs in this form:
-        # *.ics.uci.edu/*
-        # *.cs.uci.edu/*
-        # *.informatics.uci.edu/*
-        # *.stat.uci.edu/*
-        # Overall match string is r".*\.(ics|cs|informatics|stat)\.uci\.edu$"
-        return re.match(DOMAIN_PATTERN, parsed.netloc.lower()) is not None
+
+        # Check robots.txt last, only if it was already fetched. The worker
+        # fetches it before downloading from a new host, in the host's
+        # politeness turn, instead of this thread fetching it right away.
+        return ROBOTS is None or not ROBOTS.cached(url) or ROBOTS.allowed(url)
 
     except TypeError:
         print("TypeError for ", parsed)
@@ -0,0 +1,86 @@
+import unittest
+
+from unittest import mock
+
+import scraper
+
+from utils import canonical
+from utils.canonical import canonicalize, canonical_url
+from utils.seen import url_fingerprint
+
+
+class FakeResponse(object):
+    def __init__(self, url, html):
+        self.url = url
+        self.status = 200
+        self.content = html.encode("utf-8")
+        self.page = None
+
+
+class CanonicalizeTest(unittest.TestCase):
+    def setUp(self):
+        canonical._CACHE.clear()
+
+    def resolve(self, base, link):
+        return canonicalize(link, base, strip_query=True).url
+
+    def test_relative_link_on_root_page(self):
+        self.assertEqual(
+            self.resolve("https://www.ics.uci.edu", "about/index.php"),
+            "https://www.ics.uci.edu/about/index.php")
+        self.assertEqual(
+            self.resolve("https://www.ics.uci.edu/", "about/index.php"),
+            "https://www.ics.uci.edu/about/index.php")
+
+    def test_relative_link_on_directory_page(self):
+        self.assertEqual(
+            self.resolve("https://www.ics.uci.edu/about/", "people.php"),
+            "https://www.ics.uci.edu/about/people.php")
+        self.assertEqual(
+            self.resolve("https://www.ics.uci.edu/about", "people.php"),
+            "https://www.ics.uci.edu/people.php")
+        self.assertEqual(
+            self.resolve("https://www.ics.uci.edu/about/people/", "../faculty/?x=1#top"),
+            "https://www.ics.uci.edu/about/faculty/")
+
+    def test_normalizes_absolute_links(self):
+        self.assertEqual(
+            canonical_url("HTTPS://WWW.ICS.UCI.EDU:443/a/./b/../c#frag"),
+            "https://www.ics.uci.edu/a/c")
+        self.assertEqual(canonical_url("https://www.ics.uci.edu"), "https://www.ics.uci.edu/")
+
+    def test_relative_link_without_base(self):
+        canonicalize("https://www.ics.uci.edu/about/index.php")
+        self.assertIsNone(canonicalize("about/index.php"))
+
+    def test_stripping_does_not_depend_on_the_cache(self):
+        url = "https://www.ics.uci.edu/page;jsessionid=1"
+        for strip_first in (True, False):
+            canonical._CACHE.clear()
+            for strip_query in (strip_first, not strip_first):
+                self.assertEqual(
+                    canonical_url(url, strip_query=strip_query),
+                    "https://www.ics.uci.edu/page" if strip_query else url)
+
+    def test_fingerprint_ignores_trailing_slash(self):
+        self.assertEqual(url_fingerprint("https://www.ics.uci.edu/about/"),
+                         url_fingerprint("https://www.ics.uci.edu/about"))
+
+    # Scraping marks the page visited, which is_valid then rejects.
+    @mock.patch("scraper.VISITED_URLS", scraper.SeenSet())
+    def test_scraper_resolves_against_page(self):
+        html = ("<a href='about/index.php'>a</a>"
+                "<a href='/grad/'>b</a>"
+                "<a href='https://vision.ics.uci.edu'>c</a>")
+        for page_url, expected in [
+                ("https://www.ics.uci.edu", "https://www.ics.uci.edu/about/index.php"),
+                ("https://www.ics.uci.edu/dept/", "https://www.ics.uci.edu/dept/about/index.php")]:
+            links = scraper.scraper(page_url, FakeResponse(page_url, html))
+            self.assertEqual(links, [
+                expected, "https://www.ics.uci.edu/grad/", "https://vision.ics.uci.edu/"])
+            for link in links:
+                self.assertTrue(scraper.is_valid(link))
+
+
+if __name__ == "__main__":
+    unittest.main()
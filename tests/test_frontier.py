@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+import unittest
+
+from types import SimpleNamespace
+
+from crawler.frontier import Frontier
+
+
+class FlatScorer(object):
+    def score(self, url, depth, sitemap_priority=None):
+        return depth
+
+    def host_penalty(self, fetched):
+        return 0
+
+
+class FrontierRestartTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        # The frontier logs into Logs/ of the working directory.
+        os.chdir(self.directory.name)
+        self.config = SimpleNamespace(
+            save_file=os.path.join(self.directory.name, "frontier.journal"),
+            flush_interval=1.0, flush_batch=500, seen_set="exact",
+            seed_urls=["https://www.ics.uci.edu/"], stream_batch=100,
+            time_delay=0.0)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_restart_streams_a_large_snapshot_without_compacting(self):
+        urls = [f"https://host{i % 7}.ics.uci.edu/page/{i}" for i in range(3000)]
+        frontier = Frontier(self.config, True, FlatScorer())
+        frontier.add_urls(urls)
+        frontier.journal.compact(frontier.seen, frontier.pending)
+        frontier.close()
+
+        frontier = Frontier(self.config, False, FlatScorer())
+        self.assertLessEqual(frontier.queued, 2 * self.config.stream_batch)
+        self.assertGreater(frontier.journal.unread_pending, 2000)
+        frontier.journal.min_compact_records = 200
+        compactions = list()
+        compact = frontier.journal.compact
+        frontier.journal.compact = lambda *args: (
+            compactions.append(frontier.journal.unread_pending), compact(*args))
+
+        downloaded = list()
+        while True:
+            url = frontier.get_tbd_url()
+            if url is None:
+                break
+            downloaded.append(url)
+            frontier.mark_url_complete(url)
+        frontier.close()
+
+        self.assertEqual(sorted(downloaded), sorted(set(urls + self.config.seed_urls)))
+        # Counting only the urls in memory as live compacted every few
+        # hundred completions while the snapshot was still being read.
+        self.assertLessEqual(len(compactions), 2)
+
+    def test_put_back_waits_for_the_next_turn_of_the_host(self):
+        self.config.time_delay = 0.2
+        frontier = Frontier(self.config, True, FlatScorer())
+        frontier.add_url("https://www.ics.uci.edu/about", depth=1)
+        url = frontier.get_tbd_url()
+        self.assertEqual(url, "https://www.ics.uci.edu/")
+        # As if its robots.txt was downloaded in the url's turn.
+        time.sleep(0.1)
+        start = time.monotonic()
+        frontier.put_back(url)
+        self.assertEqual(frontier.get_tbd_url(), url)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        frontier.mark_url_complete(url)
+        self.assertEqual(frontier.get_tbd_url(), "https://www.ics.uci.edu/about")
+        self.assertGreaterEqual(time.monotonic() - start, 0.39)
+        frontier.close()
+
+    def test_a_turn_taken_delays_a_ready_host(self):
+        self.config.time_delay = 0.2
+        frontier = Frontier(self.config, True, FlatScorer())
+        # As if one of its sitemaps was downloaded while its seed was ready.
+        frontier.take_turn("www.ics.uci.edu")
+        time.sleep(0.1)
+        start = time.monotonic()
+        frontier.end_turn("www.ics.uci.edu")
+        self.assertEqual(frontier.get_tbd_url(), "https://www.ics.uci.edu/")
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+        start = time.monotonic()
+        frontier.take_turn("www.ics.uci.edu")
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        frontier.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import signal
+import tempfile
+import unittest
+
+from Results import Results, install_signal_handlers
+
+
+class ResultsSignalTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        # The results are checkpointed into the working directory.
+        os.chdir(self.directory.name)
+        self.handlers = [signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)]
+
+    def tearDown(self):
+        signal.signal(signal.SIGINT, self.handlers[0])
+        signal.signal(signal.SIGTERM, self.handlers[1])
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_a_signal_during_a_checkpoint_stops_once_it_is_done(self):
+        install_signal_handlers()
+        results = Results()
+        results.add_unique_page("https://www.ics.uci.edu/")
+        results.add_word_counts({"word": 2})
+        export_subdomain_json = results.export_subdomain_json
+
+        def interrupted():
+            os.kill(os.getpid(), signal.SIGINT)
+            export_subdomain_json()
+
+        results.export_subdomain_json = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            results.checkpoint()
+        for name in ("wordJSON.json", "subdomainJSON.json", "subdomainOutput.txt"):
+            self.assertTrue(os.path.exists(name), name)
+        self.assertIsNone(results.checkpoint_thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import threading
+import time
+import unittest
+
+from types import SimpleNamespace
+from urllib.robotparser import RobotFileParser
+
+from utils.robots import RobotsCache
+
+
+class RobotsCacheTest(unittest.TestCase):
+    def test_fetches_each_host_once_and_drops_its_lock(self):
+        robots = RobotsCache(SimpleNamespace(user_agent="test"))
+        fetched = list()
+
+        def fetch(scheme, host):
+            fetched.append(host)
+            time.sleep(0.01)
+            parser = RobotFileParser()
+            parser.allow_all = True
+            return parser
+
+        robots._fetch = fetch
+        urls = [f"https://host{i % 5}.ics.uci.edu/page/{i}" for i in range(40)]
+        threads = [threading.Thread(target=robots.allowed, args=(url,)) for url in urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(fetched), [f"host{i}.ics.uci.edu" for i in range(5)])
+        self.assertEqual(robots.host_locks, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import random
+import threading
+import unittest
+
+from utils.seen import SeenSet
+
+
+class SeenSetTest(unittest.TestCase):
+    def test_readers_see_every_fingerprint_while_the_table_grows(self):
+        seen = SeenSet(capacity=16)
+        fingerprints = random.Random(0)
+        # Spread over the whole table, so some are rehashed last.
+        known = [fingerprints.getrandbits(64) | 1 for _ in range(1000)]
+        for fingerprint in known:
+            seen.add_fingerprint(fingerprint)
+
+        done = threading.Event()
+        misses = list()
+
+        def read():
+            while not done.is_set() and not misses:
+                misses.extend(fingerprint for fingerprint in known
+                              if not seen.contains_fingerprint(fingerprint))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for _ in range(300000):
+                seen.add_fingerprint(fingerprints.getrandbits(64) | 1)
+        finally:
+            done.set()
+            reader.join()
+        self.assertEqual(misses, [])
+        self.assertEqual(len(seen), 301000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from types import SimpleNamespace
+
+from crawler.scoring import UrlScorer
+from utils.sitemap import SitemapSeeder
+
+
+SITEMAP = b"""<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<url><loc>https://www.ics.uci.edu/low</loc><priority>0.1</priority></url>
+<url><loc>https://www.ics.uci.edu/high</loc><priority>0.9</priority></url>
+<url><loc>https://www.ics.uci.edu/seen</loc></url>
+</urlset>"""
+
+
+class RecordingFrontier(object):
+    def __init__(self, seen):
+        self.seen = set(seen)
+        self.scorer = UrlScorer(SimpleNamespace(
+            depth_weight=1.0, host_weight=1.0, novelty_weight=1.0,
+            trap_weight=4.0, sitemap_weight=1.0))
+        self.scores = dict()
+
+    def add_urls(self, urls, parent=None, sitemap_priorities=None):
+        added = list()
+        for url, sitemap_priority in zip(urls, sitemap_priorities):
+            if url not in self.seen:
+                self.seen.add(url)
+                self.scores[url] = self.scorer.score(url, 0, sitemap_priority)
+                added.append(url)
+        return added
+
+
+class SitemapSeederTest(unittest.TestCase):
+    def test_returns_new_urls_scored_by_priority(self):
+        frontier = RecordingFrontier(["https://www.ics.uci.edu/seen"])
+        seeder = SitemapSeeder(None, frontier, lambda url: True)
+        seeder._download = lambda url: SITEMAP
+        robots = SimpleNamespace(site_maps=lambda: ["https://www.ics.uci.edu/sitemap.xml"])
+
+        seeder.host_discovered("https", "www.ics.uci.edu", robots)
+        self.assertEqual(seeder.run_pending(), [
+            "https://www.ics.uci.edu/high", "https://www.ics.uci.edu/low"])
+        self.assertLess(frontier.scores["https://www.ics.uci.edu/high"],
+                        frontier.scores["https://www.ics.uci.edu/low"])
+        self.assertEqual(seeder.run_pending(), [])
+
+    def test_skips_invalid_and_trapped_sitemaps_of_an_index(self):
+        index = b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>https://www.ics.uci.edu/sitemap1.xml.gz</loc></sitemap>
+<sitemap><loc>https://evil.com/sitemap.xml</loc></sitemap>
+<sitemap><loc>https://www.ics.uci.edu/calendar/sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+        frontier = RecordingFrontier(["https://www.ics.uci.edu/seen"])
+        seeder = SitemapSeeder(
+            None, frontier, lambda url: url.startswith("https://www.ics.uci.edu/")
+            and not url.endswith(".gz"),
+            is_trap=lambda url: "/calendar/" in url)
+        downloaded = list()
+        seeder._download = lambda url: (
+            downloaded.append(url), index if url.endswith("index.xml") else SITEMAP)[1]
+        robots = SimpleNamespace(
+            site_maps=lambda: ["https://www.ics.uci.edu/sitemap_index.xml"])
+
+        self.assertEqual(seeder.seed_host("https", "www.ics.uci.edu", robots), [
+            "https://www.ics.uci.edu/high", "https://www.ics.uci.edu/low"])
+        self.assertEqual(downloaded, [
+            "https://www.ics.uci.edu/sitemap_index.xml",
+            "https://www.ics.uci.edu/sitemap1.xml.gz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
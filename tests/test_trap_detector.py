@@ -0,0 +1,34 @@
+import unittest
+
+from TrapDetector import TrapDetector
+
+
+class TrapDetectorBlockedTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = TrapDetector(min_pages=2, max_blocked=2)
+
+    def block(self, host):
+        url = f"https://{host}.ics.uci.edu/calendar/1"
+        while not self.detector.record_page(url, "same page"):
+            pass
+        return url
+
+    def test_keeps_the_most_recently_hit_blocked_templates(self):
+        first, second = self.block("a"), self.block("b")
+        # Hitting the first template keeps it over the second.
+        self.assertFalse(self.detector.observe(first))
+        third = self.block("c")
+
+        self.assertEqual(len(self.detector.blocked), 2)
+        self.assertTrue(self.detector.is_blocked(first))
+        self.assertFalse(self.detector.is_blocked(second))
+        self.assertTrue(self.detector.is_blocked(third))
+
+        # Its statistics are still kept, so the next repeated page blocks it.
+        self.assertTrue(self.detector.record_page(second, "same page"))
+        self.assertTrue(self.detector.is_blocked(second))
+        self.assertEqual(len(self.detector.blocked), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+from TrapNavigator import TrapNavigator
+
+
+class TrapNavigatorReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        # The navigator logs into Logs/ of the working directory.
+        os.chdir(self.directory.name)
+        self.trap_file = os.path.join(self.directory.name, "traps.json")
+        self.write({"start_traps": ["www.ics.uci.edu/calendar"], "end_traps": []})
+        self.navigator = TrapNavigator(self.trap_file, reload_interval=0.0)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def write(self, rules, mtime=None):
+        with open(self.trap_file, "w") as outfile:
+            outfile.write(rules if isinstance(rules, str) else json.dumps(rules))
+        if mtime is not None:
+            os.utime(self.trap_file, (mtime, mtime))
+
+    def assertTrapped(self):
+        self.assertTrue(self.navigator.known_traps("https://www.ics.uci.edu/calendar/2020"))
+        self.assertFalse(self.navigator.known_traps("https://www.ics.uci.edu/about"))
+
+    def test_keeps_rules_when_the_file_does_not_parse(self):
+        self.assertTrapped()
+        for mtime, broken in enumerate(['{"start_traps": [', '["www.ics.uci.edu"]',
+                                        '{"start_traps": [1]}'], 1):
+            self.write(broken, mtime)
+            with self.assertLogs("TRAPS", "WARNING"):
+                self.assertTrapped()
+
+    def test_keeps_rules_when_the_file_cannot_be_read(self):
+        os.remove(self.trap_file)
+        os.mkdir(self.trap_file)
+        with self.assertLogs("TRAPS", "WARNING"):
+            self.assertTrapped()
+
+    def test_logs_a_missing_file(self):
+        os.remove(self.trap_file)
+        with self.assertLogs("TRAPS", "WARNING") as logs:
+            self.assertFalse(self.navigator.known_traps("https://www.ics.uci.edu/calendar/2020"))
+        self.assertIn("not found", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from collections import Counter
+
+from Results import Results
+from utils.word_counts import WordCounter, MAX_RUNS
+
+
+class WordCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_words_set_aside_are_read_until_spilled(self):
+        counter = WordCounter(max_words=3, directory=self.directory.name)
+        self.assertFalse(counter.update({"a": 1, "b": 2}))
+        self.assertTrue(counter.update({"c": 3}))
+        # Not written yet, but still counted.
+        self.assertEqual(counter.runs, [])
+        self.assertEqual(dict(counter.items()), {"a": 1, "b": 2, "c": 3})
+        with counter.snapshot() as snapshot:
+            counter.spill()
+            self.assertEqual(len(counter.runs), 1)
+            self.assertEqual(dict(snapshot.items()), {"a": 1, "b": 2, "c": 3})
+        counter.update({"a": 4})
+        self.assertEqual(list(counter.items()), [("a", 5), ("b", 2), ("c", 3)])
+
+    def test_spill_merges_runs(self):
+        counter = WordCounter(max_words=2, directory=self.directory.name)
+        expected = Counter()
+        for i in range(MAX_RUNS * 2 + 1):
+            counts = {f"w{i}": 1, f"w{i + 1}": 2}
+            expected.update(counts)
+            if counter.update(counts):
+                counter.spill()
+        self.assertLess(len(counter.runs), MAX_RUNS)
+        self.assertEqual(dict(counter.items()), expected)
+        self.assertEqual(len(os.listdir(counter.run_directory)), len(counter.runs))
+
+
+class ResultsWordsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def results(self):
+        return Results(checkpointed=False, max_words=4,
+                       spill_directory=self.directory.name)
+
+    def test_export_counts_streams_the_spilled_words(self):
+        source = self.results()
+        expected = Counter()
+        for i in range(20):
+            counts = {f"word{i % 7}": i, f"other{i}": 1}
+            expected.update(counts)
+            source.add_word_counts(counts)
+        self.assertTrue(source.words.runs)
+
+        exported = source.export_counts()
+        self.assertNotIsInstance(exported["words"], dict)
+        merged = self.results()
+        merged.merge_counts(exported)
+        self.assertEqual(dict(merged.words.items()), expected)
+        self.assertEqual(source.words.readers, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
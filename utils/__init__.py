@@ -5,6 +5,9 @@ from urllib.parse import urlparse
 
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
+    if logger.handlers:
+        # Already set up, more handlers would log every line again.
+        return logger
     logger.setLevel(logging.INFO)
     if not os.path.exists("Logs"):
         os.makedirs("Logs")
@@ -0,0 +1,141 @@
+import asyncio
+import cbor
+
+from urllib.parse import urlencode
+
+from utils.response import Response
+
+
+class CacheServerError(Exception):
+    """ The cache server sent something that is not a valid http response. """
+
+
+class AsyncDownloader(object):
+    """
+    Downloads urls from the cache server over a pool of persistent keep-alive
+    connections, so that fetches do not each pay for a new tcp handshake.
+    At most config.download_concurrency requests are in flight at once, each
+    one limited to config.download_timeout seconds, and failed requests are
+    retried config.download_retries times with exponential backoff.
+    """
+
+    def __init__(self, config, logger=None):
+        self.config = config
+        self.logger = logger
+        self.host, self.port = config.cache_server
+        self.timeout = config.download_timeout
+        self.retries = config.download_retries
+        self.backoff = config.download_backoff
+        self.slots = asyncio.Semaphore(config.download_concurrency)
+        self.idle = list()
+
+    async def download(self, url):
+        """
+        Downloads a url through the cache server.
+        :param url: the url to download.
+        :return: a utils.response.Response.
+        """
+        async with self.slots:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await asyncio.wait_for(
+                        self._fetch(url), self.timeout)
+                except (OSError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError, CacheServerError) as e:
+                    if attempt == self.retries:
+                        error = f"Spacetime download failed with url {url}: {e!r}."
+                        if self.logger:
+                            self.logger.error(error)
+                        return Response({
+                            "error": error, "status": 600, "url": url})
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _fetch(self, url):
+        reader, writer = await self._connect()
+        reusable = False
+        try:
+            query = urlencode([("q", url), ("u", self.config.user_agent)])
+            writer.write(
+                f"GET /?{query} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Connection: keep-alive\r\n"
+                f"Accept-Encoding: identity\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            status, headers, body, reusable = await self._read_response(reader)
+        finally:
+            if reusable:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+
+        try:
+            if body:
+                return Response(cbor.loads(body))
+        except (EOFError, ValueError):
+            pass
+        if self.logger:
+            self.logger.error(
+                f"Spacetime Response error <{status}> with url {url}.")
+        return Response({
+            "error": f"Spacetime Response error <{status}> with url {url}.",
+            "status": status,
+            "url": url})
+
+    async def _connect(self):
+        """
+        Reuses an idle pooled connection, or opens a new one.
+        :return: a (reader, writer) pair.
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def _read_response(self, reader):
+        """
+        Reads one http/1.1 response.
+        :return: the status, headers, body and whether the connection can be
+            reused for another request.
+        """
+        status_line = await reader.readline()
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise CacheServerError(f"Bad status line {status_line!r}")
+        status = int(parts[1])
+
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = list()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Skip any trailers up to the final empty line.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            reusable = False
+        return status, headers, body, reusable
+
+    async def close(self):
+        while self.idle:
+            _, writer = self.idle.pop()
+            writer.close()
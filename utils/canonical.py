@@ -0,0 +1,116 @@
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit, urljoin, quote
+
+# A url split once into the parts the crawler checks.
+#   url: the canonical url.
+#   scheme: its lowercased scheme.
+#   host: its lowercased host, without a default port.
+#   path: its path, without dot segments, "/" when it is empty.
+#   query: its query, "" when there is none or it was stripped.
+UrlParts = namedtuple("UrlParts", ["url", "scheme", "host", "path", "query"])
+
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+# Characters left as they are when a path is percent encoded.
+PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+
+# Canonical url -> UrlParts, so a url is only split once however many checks
+# it goes through. Cleared when it holds MAX_CACHED urls.
+MAX_CACHED = 1 << 16
+_CACHE = dict()
+
+
+@lru_cache(maxsize=4096)
+def _canonical_host(netloc, scheme):
+    host = netloc.lower()
+    port = DEFAULT_PORTS.get(scheme)
+    if port is not None and host.endswith(port):
+        host = host[:-len(port)]
+    return host.rstrip(".")
+
+
+def _remove_dot_segments(path):
+    segments = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    if path.endswith(("/.", "/..")):
+        segments.append("")
+    return "/".join(segments)
+
+
+def canonicalize(link, base=None, strip_query=False):
+    """
+    Resolves and normalizes a link in a single parse. The scheme and host
+    are lowercased, default ports, fragments and dot segments dropped, an
+    empty path made "/" and unsafe characters of the path percent encoded.
+    Trailing slashes are kept, as links relative to the page resolve
+    against its last directory.
+    Canonical urls are cached, so canonicalizing one again, as every check
+    down the line does, costs a dict lookup.
+    :param link: the link, absolute or relative to base.
+    :param base: the url of the page the link is on, as it was downloaded,
+        if the link is relative. It is resolved like urljoin does.
+    :param strip_query: also drop the query, and the ;parameters of the
+        last path segment.
+    :return: the UrlParts, None if the link cannot be parsed or is relative
+        without a base. Urls other than http and https are split but not
+        normalized.
+    """
+    parts = _CACHE.get(link)
+    # Only a canonical url is a key, relative links never hit the cache. It
+    # is returned as is if there is nothing to strip from it.
+    if parts is not None and parts.url == link and not (strip_query and (
+            parts.query or ";" in parts.path[parts.path.rfind("/"):])):
+        return parts
+    try:
+        link = link.strip()
+        split = urlsplit(link)
+        if not split.scheme:
+            if base is None:
+                return None
+            link = urljoin(base, link)
+            split = urlsplit(link)
+    except ValueError:
+        return None
+
+    scheme = split.scheme.lower()
+    netloc, path, query = split.netloc, split.path, split.query
+    if scheme not in DEFAULT_PORTS:
+        return UrlParts(link, scheme, netloc.lower(), path, query)
+
+    host = _canonical_host(netloc, scheme)
+    if not path.startswith("/"):
+        path = "/" + path
+    if "/." in path:
+        path = _remove_dot_segments(path)
+    if strip_query:
+        query = ""
+        params = path.find(";", path.rfind("/"))
+        if params >= 0:
+            path = path[:params]
+    if not path.isascii() or " " in path:
+        path = quote(path, safe=PATH_SAFE)
+
+    url = f"{scheme}://{host}{path}?{query}" if query else f"{scheme}://{host}{path}"
+    parts = _CACHE.get(url)
+    if parts is None:
+        parts = UrlParts(url, scheme, host, path, query)
+        if len(_CACHE) >= MAX_CACHED:
+            _CACHE.clear()
+        _CACHE[url] = parts
+    return parts
+
+
+def canonical_url(url, strip_query=False):
+    """
+    :param url: an absolute url.
+    :param strip_query: also drop the query, see canonicalize.
+    :return: the canonical url, or the url as is if it cannot be parsed.
+    """
+    parts = canonicalize(url, strip_query=strip_query)
+    return url if parts is None else parts.url
@@ -1,19 +1,118 @@
+import os
 import re
 
 
 class Config(object):
-    def __init__(self, config):
+    def __init__(self, config, directory=""):
+        """
+        :param config: the ConfigParser of the config file.
+        :param directory: the directory of the config file. Relative paths
+            of the files shared by every shard, like TRAPFILE, are resolved
+            against it. The save file, results and logs stay in the working
+            directory.
+        """
         self.user_agent = config["IDENTIFICATION"]["USERAGENT"].strip()
         print (self.user_agent)
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.parse_processes = int(
+            config["LOCAL PROPERTIES"].get("PARSEPROCESSES", fallback="0"))
+        self.parse_queue = int(
+            config["LOCAL PROPERTIES"].get("PARSEQUEUE", fallback="16"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.seen_set = config["LOCAL PROPERTIES"].get("SEENSET", fallback="exact")
+        self.flush_interval = float(
+            config["LOCAL PROPERTIES"].get("FLUSHINTERVAL", fallback="1.0"))
+        self.flush_batch = int(
+            config["LOCAL PROPERTIES"].get("FLUSHBATCH", fallback="500"))
+        self.stream_batch = int(
+            config["LOCAL PROPERTIES"].get("STREAMBATCH", fallback="1000"))
+        self.checkpoint_interval = float(
+            config["LOCAL PROPERTIES"].get("CHECKPOINTINTERVAL", fallback="30"))
+        self.checkpoint_pages = int(
+            config["LOCAL PROPERTIES"].get("CHECKPOINTPAGES", fallback="100"))
+        self.merge_pages = int(
+            config["LOCAL PROPERTIES"].get("MERGEPAGES", fallback="25"))
+        self.merge_interval = float(
+            config["LOCAL PROPERTIES"].get("MERGEINTERVAL", fallback="5"))
+        self.metrics_host = config["LOCAL PROPERTIES"].get(
+            "METRICSHOST", fallback="127.0.0.1").strip()
+        self.metrics_port = int(
+            config["LOCAL PROPERTIES"].get("METRICSPORT", fallback="0"))
+        self.metrics_interval = float(
+            config["LOCAL PROPERTIES"].get("METRICSINTERVAL", fallback="60"))
+        self.report_top_words = int(
+            config["LOCAL PROPERTIES"].get("REPORTTOPWORDS", fallback="50"))
+        self.report_top_subdomains = int(
+            config["LOCAL PROPERTIES"].get("REPORTTOPSUBDOMAINS", fallback="0"))
+        self.spill_words = int(
+            config["LOCAL PROPERTIES"].get("SPILLWORDS", fallback="1000000"))
+        self.spill_directory = config["LOCAL PROPERTIES"].get(
+            "SPILLDIR", fallback="").strip()
+        self.content_store = config["LOCAL PROPERTIES"].get(
+            "CONTENTSTORE", fallback="").strip()
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.trap_file = config["CRAWLER"].get("TRAPFILE", fallback="traps.json").strip()
+        if self.trap_file:
+            self.trap_file = os.path.join(directory, self.trap_file)
+        self.obey_robots = config["CRAWLER"].getboolean("OBEYROBOTS", fallback=True)
+        self.robots_ttl = float(
+            config["CRAWLER"].get("ROBOTSTTL", fallback="86400"))
+        self.sitemaps = config["CRAWLER"].getboolean("SITEMAPS", fallback=True)
+        self.sitemap_max_urls = int(
+            config["CRAWLER"].get("SITEMAPMAXURLS", fallback="50000"))
+        self.content_types = [
+            content_type.strip()
+            for content_type in config["CRAWLER"].get(
+                "CONTENTTYPES",
+                fallback="text/html,application/xhtml+xml,text/plain").split(",")]
+        self.max_page_bytes = int(
+            config["CRAWLER"].get("MAXPAGEBYTES", fallback="10485760"))
+        self.truncate_page_bytes = int(
+            config["CRAWLER"].get("TRUNCATEPAGEBYTES", fallback="2097152"))
+        self.near_duplicate_distance = int(
+            config["CRAWLER"].get("NEARDUPLICATEDISTANCE", fallback="3"))
+        self.depth_weight = float(
+            config["CRAWLER"].get("DEPTHWEIGHT", fallback="1.0"))
+        self.host_weight = float(
+            config["CRAWLER"].get("HOSTWEIGHT", fallback="1.0"))
+        self.novelty_weight = float(
+            config["CRAWLER"].get("NOVELTYWEIGHT", fallback="1.0"))
+        self.trap_weight = float(
+            config["CRAWLER"].get("TRAPWEIGHT", fallback="4.0"))
+        self.sitemap_weight = float(
+            config["CRAWLER"].get("SITEMAPWEIGHT", fallback="1.0"))
+
+        self.async_download = config["CONNECTION"].getboolean(
+            "ASYNCDOWNLOAD", fallback=False)
+        self.download_concurrency = int(
+            config["CONNECTION"].get("DOWNLOADCONCURRENCY", fallback="8"))
+        self.download_timeout = float(
+            config["CONNECTION"].get("DOWNLOADTIMEOUT", fallback="30"))
+        self.download_retries = int(
+            config["CONNECTION"].get("DOWNLOADRETRIES", fallback="3"))
+        self.download_backoff = float(
+            config["CONNECTION"].get("DOWNLOADBACKOFF", fallback="0.5"))
+
+        # Distributed crawling, see crawler/sharding.py. Every shard lists
+        # the host:port addresses of all the shards, and its own id. Config
+        # files without a DISTRIBUTED section crawl with a single process.
+        addresses = [
+            address.strip()
+            for address in config.get("DISTRIBUTED", "SHARDS", fallback="").split(",")]
+        self.shards = [
+            (host, int(port))
+            for host, _, port in (address.rpartition(":") for address in addresses if address)]
+        self.shard_id = int(config.get("DISTRIBUTED", "SHARDID", fallback="0"))
+        self.forward_batch = int(
+            config.get("DISTRIBUTED", "FORWARDBATCH", fallback="200"))
+        self.forward_interval = float(
+            config.get("DISTRIBUTED", "FORWARDINTERVAL", fallback="1.0"))
 
         self.cache_server = None
\ No newline at end of file
@@ -0,0 +1,114 @@
+from utils.metrics import METRICS
+
+# Bytes at the start of a page that are sniffed for binary content.
+SNIFF_BYTES = 4096
+
+# Signatures of common binary formats served without a telling extension.
+BINARY_SIGNATURES = (
+    b"%PDF-",                       # PDF
+    b"PK\x03\x04",                  # zip, docx, xlsx, pptx, jar, epub
+    b"\x1f\x8b",                    # gzip
+    b"BZh",                         # bzip2
+    b"\xfd7zXZ\x00",                # xz
+    b"7z\xbc\xaf\x27\x1c",          # 7z
+    b"Rar!\x1a\x07",                # rar
+    b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",  # doc, xls, ppt, msi
+    b"\x89PNG\r\n\x1a\n",           # png
+    b"\xff\xd8\xff",                # jpeg
+    b"GIF87a", b"GIF89a",           # gif
+    b"II*\x00", b"MM\x00*",         # tiff
+    b"OggS",                        # ogg
+    b"ID3",                         # mp3
+    b"\x7fELF",                     # executables
+    b"%!PS",                        # postscript
+)
+
+# The reasons pages are skipped, counted in the pages_skipped metric.
+SKIP_CONTENT_TYPE = "content_type"
+SKIP_TOO_LARGE = "too_large"
+SKIP_BINARY = "binary"
+
+
+def looks_binary(content):
+    """
+    Sniffs the first SNIFF_BYTES bytes of a page.
+    :param content: the raw bytes of the page.
+    :return: True if they start with a known binary signature or hold a NUL
+        byte, which text never does unless it is UTF-16.
+    """
+    head = content[:SNIFF_BYTES]
+    if head.startswith(BINARY_SIGNATURES):
+        return True
+    return b"\x00" in head and not head.startswith((b"\xff\xfe", b"\xfe\xff"))
+
+
+class ContentGate(object):
+    """
+    Decides, before a page is parsed, whether it is worth parsing: pages
+    with a content type outside content_types, larger than max_bytes, or
+    whose first bytes look binary are skipped, and pages larger than
+    truncate_bytes are parsed from their first truncate_bytes bytes only.
+    Urls without a file extension often serve PDFs, archives and data
+    dumps that the scraper's extension check cannot catch.
+    Skips are counted in the pages_skipped metric by reason, and
+    truncations in pages_truncated.
+    """
+
+    def __init__(self, content_types, max_bytes=0, truncate_bytes=0):
+        """
+        :param content_types: the media types that are parsed. A page
+            without a Content-Type header is parsed unless it looks binary.
+        :param max_bytes: pages larger than this are skipped, 0 for no limit.
+        :param truncate_bytes: pages larger than this are truncated, 0 for no
+            limit.
+        """
+        self.content_types = frozenset(
+            content_type.strip().lower() for content_type in content_types
+            if content_type.strip())
+        self.max_bytes = max_bytes
+        self.truncate_bytes = truncate_bytes
+
+    def admit(self, resp):
+        """
+        Gates the content of a downloaded page.
+        :param resp: the utils.response.Response of a 200 page.
+        :return: the bytes to parse, possibly truncated, or None if the page
+            is skipped.
+        """
+        content = resp.content
+        if content is None:
+            return None
+        reason = self.skip_reason(resp, content)
+        if reason is not None:
+            METRICS.count("pages_skipped", reason=reason)
+            return None
+        if self.truncate_bytes and len(content) > self.truncate_bytes:
+            METRICS.count("pages_truncated")
+            # A truncated html document still parses, lxml closes its tags.
+            return content[:self.truncate_bytes]
+        return content
+
+    def skip_reason(self, resp, content):
+        """
+        :return: why the page should not be parsed, or None if it should be.
+        """
+        content_type = resp.content_type
+        if content_type and content_type not in self.content_types:
+            return SKIP_CONTENT_TYPE
+        if self.max_bytes:
+            declared = self._content_length(resp)
+            if len(content) > self.max_bytes or declared > self.max_bytes:
+                return SKIP_TOO_LARGE
+        if looks_binary(content):
+            return SKIP_BINARY
+        return None
+
+    @staticmethod
+    def _content_length(resp):
+        for key, value in resp.headers.items():
+            if key.lower() == "content-length":
+                try:
+                    return int(value)
+                except (TypeError, ValueError):
+                    return 0
+        return 0
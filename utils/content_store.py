@@ -0,0 +1,172 @@
+import os
+import zlib
+
+from collections import namedtuple
+from hashlib import blake2b
+from threading import RLock
+
+# A page in the index.
+#   url: the url the page was downloaded from.
+#   digest: the hex blake2b digest of its raw content.
+#   segment: the number of the segment file holding the compressed content.
+#   offset, length: where the compressed content is in the segment.
+StoreEntry = namedtuple(
+    "StoreEntry", ["url", "digest", "segment", "offset", "length"])
+
+INDEX_FILE = "index.tsv"
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"segment-{segment:05d}.bin")
+
+
+def _read_index_lines(index_path):
+    """
+    :return: a generator of (StoreEntry, end offset of its line), stopping
+        at a torn last line.
+    """
+    end = 0
+    with open(index_path, "rb") as index:
+        for line in index:
+            if not line.endswith(b"\n"):
+                return
+            end += len(line)
+            digest, segment, offset, length, url = line[:-1].decode("utf-8").split("\t", 4)
+            yield StoreEntry(url, digest, int(segment), int(offset), int(length)), end
+
+
+def read_index(directory):
+    """
+    Streams the index of a store.
+    :param directory: the directory of the store.
+    :return: a generator of StoreEntry, one per stored page.
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return
+    for entry, _ in _read_index_lines(index_path):
+        yield entry
+
+
+def read_entries(directory, entries):
+    """
+    Reads the content of index entries, opening each segment once.
+    :param directory: the directory of the store.
+    :param entries: an iterable of StoreEntry.
+    :return: a generator of (url, raw content).
+    """
+    files = dict()
+    try:
+        for entry in entries:
+            segment = files.get(entry.segment)
+            if segment is None:
+                segment = files[entry.segment] = open(
+                    segment_path(directory, entry.segment), "rb")
+            segment.seek(entry.offset)
+            yield entry.url, zlib.decompress(segment.read(entry.length))
+    finally:
+        for segment in files.values():
+            segment.close()
+
+
+class ContentStore(object):
+    """
+    Store of the raw content of downloaded pages, so the results can be
+    rebuilt without crawling again (see rebuild.py).
+    Contents are addressed by their blake2b digest and stored once however
+    many urls return them, compressed with zlib and appended to segment
+    files of up to segment_size bytes. The index has one line per page:
+    its digest, segment, offset, length and url. Index lines are buffered
+    and only written after the segment bytes they point to are flushed, so
+    a crash never leaves the index pointing at missing content.
+    """
+
+    def __init__(self, directory, segment_size=64 << 20, flush_every=100):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_every = flush_every
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = RLock()
+        # digest -> (segment, offset, length) of every stored content.
+        self.locations = dict()
+        self.pending_lines = list()
+        index_path = os.path.join(directory, INDEX_FILE)
+        self._load_index(index_path)
+        self.index = open(index_path, "a", encoding="utf-8")
+
+        self.segment = max((location[0] for location in self.locations.values()), default=0)
+        self.segment_file = open(segment_path(directory, self.segment), "ab")
+
+    def _load_index(self, index_path):
+        """
+        Loads the locations of the stored contents, cutting off a torn line
+        left at the end of the index by a crash.
+        """
+        if not os.path.exists(index_path):
+            return
+        valid = 0
+        for entry, end in _read_index_lines(index_path):
+            self.locations[entry.digest] = (entry.segment, entry.offset, entry.length)
+            valid = end
+        if valid < os.path.getsize(index_path):
+            with open(index_path, "r+b") as index:
+                index.truncate(valid)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def put(self, url, content):
+        """
+        Stores the content of a page.
+        :param url: the url it was downloaded from.
+        :param content: the raw bytes of the page.
+        :return: True if the content was new to the store.
+        """
+        digest = blake2b(content, digest_size=16).hexdigest()
+        compressed = None
+        if digest not in self.locations:
+            compressed = zlib.compress(content, 6)
+        with self.lock:
+            location = self.locations.get(digest)
+            new = location is None
+            if new:
+                if compressed is None:
+                    compressed = zlib.compress(content, 6)
+                offset = self.segment_file.tell()
+                if offset and offset + len(compressed) > self.segment_size:
+                    self.flush()
+                    self.segment_file.close()
+                    self.segment += 1
+                    self.segment_file = open(
+                        segment_path(self.directory, self.segment), "ab")
+                    offset = 0
+                self.segment_file.write(compressed)
+                location = self.locations[digest] = (
+                    self.segment, offset, len(compressed))
+            self.pending_lines.append(
+                f"{digest}\t{location[0]}\t{location[1]}\t{location[2]}\t{url}\n")
+            if len(self.pending_lines) >= self.flush_every:
+                self.flush()
+        return new
+
+    def flush(self):
+        """
+        Flushes the segment, then the index lines pointing into it.
+        :return: None
+        """
+        with self.lock:
+            if self.segment_file.closed:
+                return
+            self.segment_file.flush()
+            os.fsync(self.segment_file.fileno())
+            if self.pending_lines:
+                self.index.write("".join(self.pending_lines))
+                self.index.flush()
+                self.pending_lines.clear()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.segment_file.close()
+            self.index.close()
@@ -2,11 +2,23 @@ import requests
 import cbor
 import time
 
+from threading import local
+
 from utils.response import Response
 
+# One keep-alive session per thread, so that downloads reuse their connection
+# to the cache server.
+_sessions = local()
+
+def get_session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
+    resp = get_session().get(
         f"http://{host}:{port}/",
         params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
     try:
@@ -0,0 +1,240 @@
+"""
+Timings and counters of the crawl, cheap enough to always be on.
+
+Stages of the crawl loop are timed into histograms with
+    with METRICS.timer("download"):
+        ...
+and events counted with METRICS.count("pages", status=200). The crawler
+serves them in the Prometheus text format at http://127.0.0.1:<METRICSPORT>/
+and logs a summary line every METRICSINTERVAL seconds.
+"""
+import threading
+import time
+
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds of the histogram buckets in seconds, from 1us to about 12
+# minutes, each sqrt(2) times the previous.
+BUCKETS = tuple(1e-6 * 2 ** (i / 2) for i in range(60))
+
+# The stages of the crawl loop, in the order they are summarized.
+STAGES = ("frontier_pop", "trap_check", "download", "decode", "parse",
+          "tokenize", "dedup", "scrape", "results", "frontier_add",
+          "checkpoint")
+
+
+class Histogram(object):
+    """
+    Counts durations into the fixed BUCKETS, with their count, sum and max.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        """
+        :return: a copy of (buckets, count, sum, max).
+        """
+        with self.lock:
+            return list(self.buckets), self.count, self.sum, self.max
+
+    @staticmethod
+    def quantile(buckets, count, q):
+        """
+        :return: the upper bound of the bucket holding the q quantile of a
+            snapshot, or 0.0 if it is empty.
+        """
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket in enumerate(buckets):
+            seen += bucket
+            if seen >= rank:
+                return BUCKETS[min(index, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+
+class _Timer(object):
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metrics(object):
+    """
+    The stage histograms and the counters of a crawl process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict()
+        # (name, ((label, value), ...)) -> count.
+        self.counters = defaultdict(int)
+        self.started = time.monotonic()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def timer(self, stage):
+        """
+        :param stage: the name of the timed stage.
+        :return: a context manager timing its block into the stage.
+        """
+        return _Timer(self.histogram(stage))
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        """
+        Adds to a counter.
+        :param name: the name of the counter.
+        :param value: how much to add.
+        :param labels: labels telling apart counts of the same name, like
+            the reason of a skip.
+        :return: None
+        """
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] += value
+
+    def counter(self, name, **labels):
+        """
+        :return: the value of a counter, summed over its labels when none
+            are given.
+        """
+        with self.lock:
+            if labels:
+                return self.counters.get((name, _label_key(labels)), 0)
+            return sum(value for (key, _), value in self.counters.items() if key == name)
+
+    def render(self):
+        """
+        :return: the metrics in the Prometheus text format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        lines = list()
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE crawler_{name}_total counter")
+            lines.extend(
+                f"crawler_{name}_total{_format_labels(labels)} {value}"
+                for (key, labels), value in counters if key == name)
+        lines.append("# TYPE crawler_stage_seconds histogram")
+        for stage, histogram in histograms:
+            buckets, count, total, _ = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(
+                    f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append(f"crawler_uptime_seconds {time.monotonic() - self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        :return: one line with the page, byte and skip counts and the median
+            and 95th percentile of every stage.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        pages = self.counter("pages")
+        parts = [
+            f"{pages} pages ({pages / elapsed:.1f}/s)",
+            f"{self.counter('bytes') / 1e6:.1f} MB",
+            f"{self.counter('pages_skipped')} skipped"]
+        with self.lock:
+            stages = sorted(
+                self.histograms,
+                key=lambda stage: (STAGES.index(stage) if stage in STAGES else len(STAGES), stage))
+        for stage in stages:
+            buckets, count, _, _ = self.histograms[stage].snapshot()
+            if count:
+                parts.append(
+                    f"{stage} p50 {1000 * Histogram.quantile(buckets, count, 0.5):.3f}ms "
+                    f"p95 {1000 * Histogram.quantile(buckets, count, 0.95):.3f}ms")
+        return " | ".join(parts)
+
+    def serve(self, host, port):
+        """
+        Serves the metrics over HTTP from a daemon thread.
+        :return: the ThreadingHTTPServer.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def report_every(self, interval, logger):
+        """
+        Logs the summary every interval seconds from a daemon thread.
+        :return: a threading.Event that stops the reports when set.
+        """
+        stopped = threading.Event()
+
+        def report():
+            while not stopped.wait(interval):
+                logger.info(self.summary())
+
+        threading.Thread(target=report, daemon=True).start()
+        return stopped
+
+
+# The metrics of this process.
+METRICS = Metrics()
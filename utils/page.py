@@ -0,0 +1,55 @@
+import re
+
+from collections import namedtuple
+
+from lxml import etree, html
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# The parts of a page that the crawler uses.
+#   links: the href of every <a> tag, as written in the page.
+#   text: the visible text of the page.
+#   tokens: the words of the text, in order.
+Page = namedtuple("Page", ["links", "text", "tokens"])
+EMPTY_PAGE = Page([], "", [])
+
+
+def parse_content(content):
+    """
+    Parses an html document once and extracts everything the crawler needs
+    from that single tree.
+    :param content: the raw bytes (or text) of the page.
+    :return: a Page.
+    """
+    if not content:
+        return EMPTY_PAGE
+    try:
+        root = html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        return EMPTY_PAGE
+
+    links = [href for href in
+             (anchor.get("href") for anchor in root.iter("a"))
+             if href is not None]
+
+    # Scripts, styles and comments are not part of the visible text.
+    etree.strip_elements(
+        root, etree.Comment, "script", "style", "noscript", with_tail=False)
+    text = " ".join(root.itertext())
+    return Page(links, text, TOKEN_PATTERN.findall(text))
+
+
+def parse_page(resp):
+    """
+    Returns the parsed page of a response, parsing it on first use. The
+    result is kept on the response so the scraper and the worker share it.
+    :param resp: the utils.response.Response of the page.
+    :return: a Page, empty for anything but a 200 response with content.
+    """
+    page = getattr(resp, "page", None)
+    if page is None:
+        page = EMPTY_PAGE
+        if resp.status == 200 and resp.content is not None:
+            page = parse_content(resp.content)
+        resp.page = page
+    return page
@@ -1,14 +1,165 @@
+import io
 import pickle
 
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils.metrics import METRICS
+
+# The modules of the objects pickled inside a requests.Response.
+_REQUESTS_MODULES = ("requests", "urllib3", "http.cookiejar")
+
+
+class _PickledState(object):
+    """
+    Stands in for the requests classes while unpickling, keeping only the
+    state they were pickled with.
+    """
+
+    def __setstate__(self, state):
+        self.state = state
+
+
+class _LeanUnpickler(pickle.Unpickler):
+    """
+    Unpickles a requests.Response into the dict of its pickled attributes,
+    without building the headers, cookie jar and request objects.
+    """
+
+    def find_class(self, module, name):
+        if module.split(".", 1)[0] in _REQUESTS_MODULES:
+            return _PickledState
+        return super().find_class(module, name)
+
+
+def _lean_state(pickled):
+    """
+    :param pickled: a pickled requests.Response.
+    :return: a dict of its attributes, with the headers as a plain dict.
+    """
+    # BytesIO shares the pickle's bytes, so the body is copied out once.
+    response = _LeanUnpickler(io.BytesIO(pickled)).load()
+    state = dict(getattr(response, "state", None) or {})
+    headers = state.get("headers")
+    store = getattr(headers, "state", None) or {}
+    # CaseInsensitiveDict pickles its {lowercase key: (key, value)} store.
+    store = store.get("_store", store) if isinstance(store, dict) else {}
+    state["headers"] = dict(store.values())
+    return state
+
+
 class Response(object):
+    """
+    A page as answered by the cache server, which sends it as a pickled
+    requests.Response.
+    Nothing is unpickled until the page is used. The body and content type
+    are then read with a lean unpickler that skips building the requests
+    objects, and the pickle is dropped, so only one copy of the body is
+    kept. The full requests.Response is only built, sharing that body, when
+    raw_response is used. Pages that are not used, like most that are not
+    200, are never unpickled.
+    """
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        self._pickled = resp_dict.get("response")
+        self._state = None
+        self._raw_response = None
+        self._raw_response_built = False
+
+    def _load_state(self):
+        """
+        Unpickles the attributes of the requests.Response, once.
+        :return: the dict of attributes, empty if there is no response.
+        """
+        if self._state is None:
+            state = dict()
+            if self._pickled is not None:
+                with METRICS.timer("decode"):
+                    try:
+                        state = _lean_state(self._pickled)
+                    except Exception:
+                        # Not a pickle of the expected shape, unpickle it fully.
+                        state = self._full_state()
+            self._state = state
+            self._pickled = None
+        return self._state
+
+    def _full_state(self):
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
+            raw_response = pickle.loads(self._pickled)
         except TypeError:
-            self.raw_response = None
+            return dict()
+        self._raw_response, self._raw_response_built = raw_response, True
+        if raw_response is None:
+            return dict()
+        return {
+            "_content": raw_response.content,
+            "status_code": raw_response.status_code,
+            "headers": dict(raw_response.headers),
+            "url": raw_response.url,
+            "encoding": raw_response.encoding,
+            "reason": raw_response.reason,
+        }
+
+    @property
+    def content(self):
+        """
+        The raw bytes of the page, or None without a response.
+        """
+        return self._load_state().get("_content")
+
+    @property
+    def headers(self):
+        """
+        The headers of the page as a plain dict, empty without a response.
+        """
+        return self._load_state().get("headers") or {}
+
+    @property
+    def content_type(self):
+        """
+        The lowercased media type of the page, without its parameters, or
+        "" if it has none.
+        """
+        for key, value in self.headers.items():
+            if key.lower() == "content-type":
+                return str(value).split(";", 1)[0].strip().lower()
+        return ""
+
+    @property
+    def raw_response(self):
+        """
+        The requests.Response of the page, or None without one.
+        """
+        if not self._raw_response_built:
+            state = self._load_state()
+            if not self._raw_response_built:
+                self._raw_response = self._build_raw_response(state)
+                self._raw_response_built = True
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._raw_response, self._raw_response_built = raw_response, True
+
+    @staticmethod
+    def _build_raw_response(state):
+        if not state:
+            return None
+        raw_response = requests.Response()
+        raw_response._content = state.get("_content")
+        raw_response._content_consumed = True
+        raw_response.status_code = state.get("status_code")
+        raw_response.headers = CaseInsensitiveDict(state.get("headers") or {})
+        raw_response.url = state.get("url")
+        raw_response.encoding = state.get("encoding")
+        raw_response.reason = state.get("reason")
+        elapsed = state.get("elapsed")
+        if isinstance(elapsed, timedelta):
+            raw_response.elapsed = elapsed
+        return raw_response
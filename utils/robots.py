@@ -0,0 +1,117 @@
+import time
+
+from threading import Lock
+from urllib.robotparser import RobotFileParser
+
+from utils.canonical import canonicalize
+from utils.download import download
+
+
+class RobotsCache(object):
+    """
+    Fetches the robots.txt of each host once through the cache server, and
+    keeps the parsed rules for ttl seconds.
+    When a host asks for a Crawl-delay, it is passed to on_crawl_delay(host,
+    delay), so the frontier can slow down its politeness for that host.
+    Every fetched robots.txt is also passed to on_fetch(scheme, host, rules).
+    """
+
+    def __init__(self, config, logger=None, ttl=86400.0, on_crawl_delay=None,
+                 on_fetch=None):
+        self.config = config
+        self.logger = logger
+        self.ttl = ttl
+        self.on_crawl_delay = on_crawl_delay
+        self.on_fetch = on_fetch
+        # (scheme, host) -> (expiry time, RobotFileParser)
+        self.rules = dict()
+        self.lock = Lock()
+        # (scheme, host) -> [Lock, threads using it], only while the rules of
+        # the host are being fetched, so there is one per thread at most.
+        self.host_locks = dict()
+
+    def _fetch(self, scheme, host):
+        """
+        Downloads and parses the robots.txt of a host.
+        As browsers and crawlers usually do, a 401 or 403 disallows the whole
+        host, and any other failure allows it.
+        :return: the RobotFileParser.
+        """
+        robots_url = f"{scheme}://{host}/robots.txt"
+        parser = RobotFileParser(robots_url)
+        try:
+            resp = download(robots_url, self.config, self.logger)
+        except Exception:
+            if self.logger:
+                self.logger.exception(f"Failed to download {robots_url}.")
+            parser.allow_all = True
+            return parser
+
+        if resp.status == 200 and resp.content is not None:
+            content = resp.content
+            parser.parse(content.decode("utf-8", "replace").splitlines())
+        elif resp.status in (401, 403):
+            parser.disallow_all = True
+        else:
+            parser.allow_all = True
+        parser.modified()
+
+        delay = parser.crawl_delay(self.config.user_agent)
+        if delay and self.on_crawl_delay:
+            self.on_crawl_delay(host, float(delay))
+        if self.on_fetch:
+            self.on_fetch(scheme, host, parser)
+        return parser
+
+    def get(self, scheme, host):
+        """
+        Gets the rules of a host, fetching them if they are missing or
+        expired. Only one thread fetches a given host at a time.
+        :return: the RobotFileParser.
+        """
+        key = (scheme, host)
+        entry = self.rules.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        with self.lock:
+            host_lock = self.host_locks.get(key)
+            if host_lock is None:
+                host_lock = self.host_locks[key] = [Lock(), 0]
+            host_lock[1] += 1
+        try:
+            with host_lock[0]:
+                entry = self.rules.get(key)
+                if entry is None or entry[0] <= time.monotonic():
+                    entry = (time.monotonic() + self.ttl, self._fetch(scheme, host))
+                    self.rules[key] = entry
+        finally:
+            with self.lock:
+                host_lock[1] -= 1
+                if not host_lock[1]:
+                    del self.host_locks[key]
+        return entry[1]
+
+    def cached(self, url):
+        """
+        :param url: a url.
+        :return: True if the rules of the url's host are known and fresh,
+            so allowed does not download anything.
+        """
+        parsed = canonicalize(url)
+        if parsed is None:
+            return True
+        entry = self.rules.get((parsed.scheme, parsed.host))
+        return entry is not None and entry[0] > time.monotonic()
+
+    def allowed(self, url):
+        """
+        Checks whether the robots.txt of the url's host allows crawling it.
+        :param url: the url to check.
+        :return: True if the url may be crawled.
+        """
+        parsed = canonicalize(url)
+        if parsed is None:
+            return False
+        rules = self.get(parsed.scheme, parsed.host)
+        return rules.can_fetch(self.config.user_agent, url)
@@ -0,0 +1,257 @@
+import math
+import os
+
+from array import array
+from hashlib import blake2b
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils.canonical import canonicalize
+
+
+def url_fingerprint(url):
+    """
+    Hashes a url to a non zero 64 bit int. Like get_urlhash, the scheme is
+    ignored. The host is lowercased and trailing slashes are dropped, so the
+    same page always gets the same fingerprint.
+    :param url: the url.
+    :return: the fingerprint.
+    """
+    parts = canonicalize(url)
+    if parts is not None:
+        # The parts of a canonical url are cached, so it is not parsed again.
+        key = f"{parts.host}/{parts.path.rstrip('/')}//{parts.query}/"
+    else:
+        parsed = urlparse(url)
+        key = (f"{parsed.netloc.lower()}/{parsed.path.rstrip('/')}/{parsed.params}/"
+               f"{parsed.query}/{parsed.fragment}")
+    fingerprint = int.from_bytes(
+        blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return fingerprint or 1
+
+
+class SeenSet(object):
+    """
+    Set of urls that stores only their 64 bit fingerprints, in an open
+    addressing hash table backed by an array. Each url takes 8 bytes in the
+    table, at most 16 bytes with the table half full, where a set of url
+    strings takes hundreds.
+    Adding takes the lock. Checking does not: it reads the table once, and
+    a grown table is only swapped in once it holds every fingerprint.
+    """
+    MAGIC = b"SEEN0001"
+    MAX_LOAD = 0.5
+
+    def __init__(self, capacity=1 << 16):
+        self.lock = Lock()
+        self.table = self._new_table(capacity)
+        self.count = 0
+
+    @staticmethod
+    def _new_table(capacity):
+        capacity = 1 << max(4, math.ceil(math.log2(capacity)))
+        return array("Q", bytes(8 * capacity))
+
+    @staticmethod
+    def _slot(table, fingerprint):
+        """
+        Finds the slot of a table holding the fingerprint, or the empty slot
+        where it would go.
+        """
+        mask = len(table) - 1
+        slot = fingerprint & mask
+        while True:
+            value = table[slot]
+            if value == fingerprint or value == 0:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        table = self._new_table(len(self.table) * 2)
+        for fingerprint in self.table:
+            if fingerprint:
+                table[self._slot(table, fingerprint)] = fingerprint
+        self.table = table
+
+    def add_fingerprint(self, fingerprint):
+        """
+        Adds a fingerprint.
+        :return: True if it was not in the set before.
+        """
+        with self.lock:
+            table = self.table
+            slot = self._slot(table, fingerprint)
+            if table[slot]:
+                return False
+            table[slot] = fingerprint
+            self.count += 1
+            if self.count > self.MAX_LOAD * len(self.table):
+                self._grow()
+            return True
+
+    def contains_fingerprint(self, fingerprint):
+        table = self.table
+        return table[self._slot(table, fingerprint)] != 0
+
+    def add(self, url):
+        """
+        Adds a url.
+        :return: True if it was not in the set before.
+        """
+        return self.add_fingerprint(url_fingerprint(url))
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url))
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        """
+        Writes the set to a file, through a temporary file and a rename.
+        :param path: the file to write.
+        :return: None
+        """
+        temp_path = f"{path}.tmp"
+        with self.lock, open(temp_path, "wb") as outfile:
+            outfile.write(self.MAGIC)
+            outfile.write(self.count.to_bytes(8, "little"))
+            self.table.tofile(outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, path)
+
+    def read(self, path):
+        """
+        Replaces the contents of the set with a file written by save.
+        :param path: the file to read.
+        :return: None
+        """
+        with open(path, "rb") as infile:
+            if infile.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"{path} is not a saved {type(self).__name__}")
+            count = int.from_bytes(infile.read(8), "little")
+            table = array("Q")
+            table.frombytes(infile.read())
+        with self.lock:
+            self.table, self.count = table, count
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over url fingerprints, sized for capacity entries at the
+    given false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self.bits = bits
+        self.array = bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fingerprint):
+        # Double hashing of the two halves of the fingerprint.
+        first, second = fingerprint & 0xFFFFFFFF, fingerprint >> 32 | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.bits
+
+    def add_fingerprint(self, fingerprint):
+        """
+        :return: True if the fingerprint was (probably) not present.
+        """
+        new = False
+        for position in self._positions(fingerprint):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.array[byte] & mask:
+                self.array[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def contains_fingerprint(self, fingerprint):
+        return all(self.array[position >> 3] & 1 << (position & 7)
+                   for position in self._positions(fingerprint))
+
+
+class BloomSeenSet(SeenSet):
+    """
+    Approximate set of urls backed by a scalable Bloom filter, for crawls too
+    large for even SeenSet: about 10 bits per url at a 1% false positive
+    rate. A false positive makes an unseen url look seen, so a small share of
+    urls are skipped. Each time the current filter fills up, a new one twice
+    its size with half its error rate is added, keeping the overall false
+    positive rate below error_rate however many urls are added.
+    """
+    MAGIC = b"BLOOM001"
+
+    def __init__(self, capacity=1 << 16, error_rate=0.01):
+        self.lock = Lock()
+        self.initial_capacity = capacity
+        self.initial_error_rate = error_rate
+        self.filters = [BloomFilter(capacity, error_rate / 2)]
+        self.count = 0
+
+    def add_fingerprint(self, fingerprint):
+        with self.lock:
+            if self.contains_fingerprint(fingerprint):
+                return False
+            current = self.filters[-1]
+            if current.count >= current.capacity:
+                current = BloomFilter(
+                    current.capacity * 2, current.error_rate / 2)
+                self.filters.append(current)
+            current.add_fingerprint(fingerprint)
+            self.count += 1
+            return True
+
+    def contains_fingerprint(self, fingerprint):
+        return any(bloom.contains_fingerprint(fingerprint)
+                   for bloom in self.filters)
+
+    def save(self, path):
+        temp_path = f"{path}.tmp"
+        with self.lock, open(temp_path, "wb") as outfile:
+            outfile.write(self.MAGIC)
+            outfile.write(self.count.to_bytes(8, "little"))
+            outfile.write(len(self.filters).to_bytes(8, "little"))
+            for bloom in self.filters:
+                outfile.write(bloom.capacity.to_bytes(8, "little"))
+                outfile.write(bloom.count.to_bytes(8, "little"))
+                outfile.write(repr(bloom.error_rate).encode("ascii").ljust(32))
+                outfile.write(bloom.array)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, path)
+
+    def read(self, path):
+        with open(path, "rb") as infile:
+            if infile.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"{path} is not a saved {type(self).__name__}")
+            count = int.from_bytes(infile.read(8), "little")
+            filters = list()
+            for _ in range(int.from_bytes(infile.read(8), "little")):
+                capacity = int.from_bytes(infile.read(8), "little")
+                bloom_count = int.from_bytes(infile.read(8), "little")
+                bloom = BloomFilter(capacity, float(infile.read(32).strip()))
+                bloom.count = bloom_count
+                bloom.array = bytearray(infile.read(len(bloom.array)))
+                filters.append(bloom)
+        with self.lock:
+            self.filters, self.count = filters, count
+
+
+def make_seen_set(kind):
+    """
+    Creates the seen set configured by SEENSET.
+    :param kind: "exact" for a SeenSet, "bloom" for a BloomSeenSet.
+    :return: the empty set.
+    """
+    if kind == "bloom":
+        return BloomSeenSet()
+    if kind == "exact":
+        return SeenSet()
+    raise ValueError(f"Unknown seen set {kind!r}, use exact or bloom.")
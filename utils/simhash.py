@@ -0,0 +1,111 @@
+from array import array
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+
+FINGERPRINT_BITS = 64
+# Each bit of a token's hash gets its own 32 bit lane in one big integer, so
+# that summing the weighted tokens of a page adds up every bit position at
+# once instead of looping over the 64 bits of every token.
+LANE_BITS = 32
+LANE_MASK = (1 << LANE_BITS) - 1
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_lanes(token):
+    """
+    Hashes a token to 64 bits and spreads the set bits into lanes.
+    :param token: the token.
+    :return: an integer with lane i set to 1 if bit i of the hash is set.
+    """
+    hashed = int.from_bytes(
+        blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    lanes = 0
+    for bit in range(FINGERPRINT_BITS):
+        if hashed >> bit & 1:
+            lanes |= 1 << (bit * LANE_BITS)
+    return lanes
+
+
+def simhash(word_counts):
+    """
+    Computes the 64 bit SimHash of a page. Pages with similar words get
+    fingerprints that differ in only a few bits.
+    :param word_counts: a mapping of token -> count on the page.
+    :return: the fingerprint as an int.
+    """
+    total = 0
+    lanes = 0
+    for token, count in word_counts.items():
+        lanes += count * _token_lanes(token)
+        total += count
+
+    # Bit i is set when the tokens with bit i set outweigh the others.
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if 2 * (lanes >> (bit * LANE_BITS) & LANE_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimhashIndex(object):
+    """
+    Index of fingerprints for finding near duplicates, those within
+    max_distance bits of each other.
+    The 64 bits are cut into max_distance + 1 blocks. Two fingerprints that
+    differ in at most max_distance bits must agree on at least one whole
+    block, so each block keys its own table, and a lookup only compares
+    against the fingerprints sharing a block with it instead of all of them.
+    Buckets are arrays of unsigned 64 bit ints, 8 bytes per fingerprint and
+    table.
+    """
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        edges = [FINGERPRINT_BITS * i // blocks for i in range(blocks + 1)]
+        self.blocks = [
+            (start, (1 << (end - start)) - 1)
+            for start, end in zip(edges, edges[1:])]
+        self.tables = [dict() for _ in self.blocks]
+        self.lock = Lock()
+        self.count = 0
+
+    def find(self, fingerprint):
+        """
+        Finds a stored fingerprint near the given one.
+        :param fingerprint: the fingerprint to look up.
+        :return: the near fingerprint, or None if there is none.
+        """
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            bucket = table.get(fingerprint >> shift & mask)
+            if bucket is None:
+                continue
+            for candidate in bucket:
+                if hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        """
+        Adds a fingerprint unless a near one is already stored.
+        :param fingerprint: the fingerprint of a page.
+        :return: the near fingerprint already stored, or None if the
+            fingerprint is new and was added.
+        """
+        with self.lock:
+            near = self.find(fingerprint)
+            if near is not None:
+                return near
+            for table, (shift, mask) in zip(self.tables, self.blocks):
+                key = fingerprint >> shift & mask
+                bucket = table.get(key)
+                if bucket is None:
+                    bucket = table[key] = array("Q")
+                bucket.append(fingerprint)
+            self.count += 1
+            return None
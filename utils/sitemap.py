@@ -0,0 +1,203 @@
+import zlib
+
+from collections import deque, namedtuple
+from threading import Lock
+from xml.etree.ElementTree import XMLPullParser, ParseError
+
+from utils.canonical import canonicalize
+from utils.download import download
+
+# An entry of a sitemap.
+#   loc: the url.
+#   lastmod: the last modification date as written, "" if missing.
+#   priority: the priority between 0 and 1, 0.5 if missing.
+#   is_index: True if loc is another sitemap, from a sitemap index.
+SitemapEntry = namedtuple(
+    "SitemapEntry", ["loc", "lastmod", "priority", "is_index"])
+
+WELL_KNOWN_SITEMAPS = ("/sitemap.xml", "/sitemap_index.xml")
+CHUNK_SIZE = 1 << 16
+
+
+def _chunks(content):
+    """
+    Yields the content in chunks, decompressing it on the fly if gzipped.
+    """
+    view = memoryview(content)
+    if content[:2] == b"\x1f\x8b":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield decompressor.decompress(view[start:start + CHUNK_SIZE])
+        yield decompressor.flush()
+    else:
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_sitemap(content):
+    """
+    Streams the entries of a sitemap or sitemap index. Each <url> or
+    <sitemap> element is dropped as soon as it is read, so the document is
+    never held as a whole tree.
+    :param content: the raw, possibly gzipped, bytes of the sitemap.
+    :return: a generator of SitemapEntry.
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    root = None
+    fields = dict()
+    try:
+        for chunk in _chunks(content):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if root is None:
+                    root = element
+                if event != "end":
+                    continue
+                name = _local_name(element.tag)
+                if name in ("loc", "lastmod", "priority"):
+                    fields[name] = (element.text or "").strip()
+                elif name in ("url", "sitemap"):
+                    if fields.get("loc"):
+                        try:
+                            priority = float(fields.get("priority") or 0.5)
+                        except ValueError:
+                            priority = 0.5
+                        yield SitemapEntry(
+                            fields["loc"], fields.get("lastmod", ""),
+                            priority, name == "sitemap")
+                    fields.clear()
+                    root.clear()
+        parser.close()
+    except (ParseError, zlib.error):
+        return
+
+
+class SitemapSeeder(object):
+    """
+    Seeds the frontier from the sitemaps of each host.
+    Sitemaps are found through the Sitemap lines of the host's robots.txt,
+    or at the well known paths. Their urls are bulk inserted into the
+    frontier, highest priority and most recently modified first.
+    Hosts are queued by host_discovered, as the robots cache sees them, and
+    seeded by run_pending, which workers call between pages. The worker
+    counts the new urls it returns as unique pages. Each url is scored with
+    its sitemap priority.
+    Sitemaps are downloaded in the host's turn of the frontier, as its pages
+    are, and only those is_valid accepts and is_trap does not are read.
+    """
+
+    def __init__(self, config, frontier, is_valid, logger=None,
+                 max_urls=50000, max_sitemaps=50, is_trap=None):
+        self.config = config
+        self.frontier = frontier
+        self.is_valid = is_valid
+        self.is_trap = is_trap
+        self.logger = logger
+        self.max_urls = max_urls
+        self.max_sitemaps = max_sitemaps
+
+        self.lock = Lock()
+        self.seeding = Lock()
+        self.seen_hosts = set()
+        self.pending = deque()
+
+    def host_discovered(self, scheme, host, robots):
+        """
+        Queues a host for seeding, the first time it is seen.
+        :param scheme: the scheme its robots.txt was fetched with.
+        :param host: the host.
+        :param robots: the RobotFileParser of its robots.txt.
+        :return: None
+        """
+        with self.lock:
+            if host in self.seen_hosts:
+                return
+            self.seen_hosts.add(host)
+            self.pending.append((scheme, host, robots))
+
+    def run_pending(self):
+        """
+        Seeds the queued hosts. Only one thread seeds at a time, the others
+        return straight away.
+        :return: the list of the new urls added to the frontier.
+        """
+        added = list()
+        if not self.pending or not self.seeding.acquire(blocking=False):
+            return added
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        return added
+                    scheme, host, robots = self.pending.popleft()
+                try:
+                    added.extend(self.seed_host(scheme, host, robots))
+                except Exception:
+                    if self.logger:
+                        self.logger.exception(f"Failed to seed {host} from its sitemaps.")
+        finally:
+            self.seeding.release()
+
+    def _download(self, url):
+        host = canonicalize(url).host
+        self.frontier.take_turn(host)
+        try:
+            resp = download(url, self.config, self.logger)
+        finally:
+            self.frontier.end_turn(host)
+        if resp.status != 200:
+            return None
+        return resp.content
+
+    def _is_trap(self, url):
+        return self.is_trap is not None and self.is_trap(url)
+
+    def _is_allowed_sitemap(self, url):
+        """
+        Checks a sitemap listed by a sitemap index, before it is downloaded.
+        Sitemaps may be gzipped, which is_valid rejects for pages.
+        """
+        page_url = url[:-len(".gz")] if url.endswith(".gz") else url
+        return self.is_valid(page_url) and not self._is_trap(url)
+
+    def seed_host(self, scheme, host, robots):
+        """
+        Reads the sitemaps of a host and adds their urls to the frontier.
+        :return: the list of the new urls added.
+        """
+        sitemaps = deque((robots.site_maps() if robots else None) or [])
+        if not sitemaps:
+            sitemaps.extend(f"{scheme}://{host}{path}" for path in WELL_KNOWN_SITEMAPS)
+
+        entries = list()
+        fetched = set()
+        while sitemaps and len(fetched) < self.max_sitemaps and len(entries) < self.max_urls:
+            sitemap_url = sitemaps.popleft()
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+            content = self._download(sitemap_url)
+            if not content:
+                continue
+            for entry in parse_sitemap(content):
+                if entry.is_index:
+                    if self._is_allowed_sitemap(entry.loc):
+                        sitemaps.append(entry.loc)
+                elif self.is_valid(entry.loc) and not self._is_trap(entry.loc):
+                    entries.append(entry)
+                    if len(entries) >= self.max_urls:
+                        break
+
+        # ISO 8601 dates sort correctly as strings.
+        entries.sort(key=lambda entry: (entry.priority, entry.lastmod), reverse=True)
+        added = self.frontier.add_urls(
+            [entry.loc for entry in entries],
+            sitemap_priorities=[entry.priority for entry in entries])
+        if self.logger and entries:
+            self.logger.info(
+                f"Added {len(added)} of {len(entries)} urls from the sitemaps of {host}.")
+        return added
@@ -0,0 +1,333 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+from collections import Counter
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+
+# Buffer size of the run files, which are only read and written in order.
+RUN_BUFFER = 1 << 20
+
+# Bytes of lines decoded at once from each run being merged.
+READ_CHUNK = 1 << 16
+
+# Runs merged into one once there are this many, to bound the files a merge
+# has open.
+MAX_RUNS = 8
+
+
+def _write_run(path, items):
+    """
+    Writes (word, count) pairs as "word\\tcount" lines. Words never hold tabs
+    or newlines, the tokenizer only keeps word characters.
+    """
+    with open(path, "w", encoding="utf-8", newline="", buffering=RUN_BUFFER) as outfile:
+        outfile.writelines(f"{word}\t{count}\n" for word, count in items)
+
+
+def _read_run(path):
+    """
+    :return: a generator of the (word, count) pairs of a run file.
+    """
+    with open(path, "r", encoding="utf-8", newline="", buffering=RUN_BUFFER) as infile:
+        while True:
+            lines = infile.readlines(READ_CHUNK)
+            if not lines:
+                return
+            yield from [(word, int(count)) for word, count in
+                        (line[:-1].split("\t") for line in lines)]
+
+
+def _merge_sorted(iterables):
+    """
+    Merges iterables of (word, count) sorted by word, adding up the counts
+    of the same word.
+    :return: a generator of (word, count) sorted by word.
+    """
+    # A word is at most once in each iterable, so its pairs compare by word.
+    merged = heapq.merge(*iterables)
+    for word, total in merged:
+        break
+    else:
+        return
+    for next_word, count in merged:
+        if next_word == word:
+            total += count
+        else:
+            yield word, total
+            word, total = next_word, count
+    yield word, total
+
+
+def _most_common_key(item):
+    return -item[1], item[0]
+
+
+class WordCounter(object):
+    """
+    Word counts that keep at most max_words words in memory.
+    Once max_words different words are counted, they are set aside, and
+    counting starts over in memory. spill then sorts them into a run file.
+    Reading the counts merges the runs and the words in memory with a k-way
+    merge, so memory stays bounded however many words the crawl finds.
+    Every MAX_RUNS runs are merged into one. The runs live in a temporary
+    directory, removed with the counter.
+    With max_words 0 nothing is spilled, and it is a plain Counter.
+    update, clear and snapshot are not thread safe: Results calls them
+    under its lock. spill is, and is called after releasing that lock, so
+    the other workers keep counting while the runs are written.
+    """
+
+    def __init__(self, max_words=0, directory=""):
+        """
+        :param max_words: the most words kept in memory, 0 for no limit.
+        :param directory: where the run directory is created, "" for the
+            system's temporary directory.
+        """
+        self.max_words = max_words
+        self.directory = directory
+        self.counts = Counter()
+        self.runs = list()
+        # Counters set aside by update and not written to a run yet. They
+        # are no longer changed, so snapshots read them without a copy.
+        self.spilling = list()
+        self.run_directory = None
+        self.next_run = 0
+        # Guards the runs and the counters being spilled, shared with
+        # snapshots. Runs merged into another are only deleted once no
+        # snapshot reads them.
+        self.lock = threading.Lock()
+        # Only one thread writes runs at a time.
+        self.spill_lock = threading.Lock()
+        self.readers = 0
+        self.retired = list()
+
+    def update(self, counts):
+        """
+        Adds counts. Once there are too many words in memory, they are set
+        aside to be written by spill.
+        :param counts: a mapping of word -> count.
+        :return: True if spill should be called.
+        """
+        self.counts.update(counts)
+        if self.max_words and len(self.counts) >= self.max_words:
+            with self.lock:
+                self.spilling.append(self.counts)
+            self.counts = Counter()
+            return True
+        return False
+
+    def spill(self):
+        """
+        Writes the words set aside by update to new sorted runs, and merges
+        the runs once there are MAX_RUNS of them.
+        :return: None
+        """
+        with self.spill_lock:
+            while True:
+                with self.lock:
+                    if not self.spilling:
+                        return
+                    counts = self.spilling[0]
+                path = self._run_path()
+                _write_run(path, sorted(counts.items()))
+                with self.lock:
+                    # In one step, so snapshots see the words exactly once.
+                    del self.spilling[0]
+                    self.runs.append(path)
+                    if len(self.runs) < MAX_RUNS:
+                        continue
+                    runs = list(self.runs)
+                # Snapshots taken meanwhile read the old runs, which are
+                # retired and deleted once they are closed.
+                path = self._run_path()
+                _write_run(path, _merge_sorted([_read_run(run) for run in runs]))
+                with self.lock:
+                    self.runs = [path]
+                    self.retired.extend(runs)
+                    self._remove_retired()
+
+    def _run_path(self):
+        """
+        :return: the path of a new run file.
+        """
+        if self.run_directory is None:
+            self.run_directory = tempfile.mkdtemp(
+                prefix="words-", dir=self.directory or None)
+            weakref.finalize(self, shutil.rmtree, self.run_directory, True)
+        path = os.path.join(self.run_directory, f"run-{self.next_run:06d}.tsv")
+        self.next_run += 1
+        return path
+
+    def _remove_retired(self):
+        """
+        Deletes the merged runs no snapshot reads. Must be called with the
+        lock held.
+        """
+        if not self.readers:
+            for path in self.retired:
+                os.remove(path)
+            self.retired.clear()
+
+    def clear(self):
+        """
+        Forgets every count.
+        :return: None
+        """
+        self.counts = Counter()
+        with self.spill_lock, self.lock:
+            self.spilling = list()
+            self.retired.extend(self.runs)
+            self.runs = list()
+            self._remove_retired()
+
+    def snapshot(self):
+        """
+        Copies the words in memory and holds on to the current runs and the
+        words being spilled, so the counts can be read while counting goes
+        on.
+        :return: a WordCountsSnapshot, to be closed once read.
+        """
+        with self.lock:
+            self.readers += 1
+            runs = list(self.runs)
+            spilling = list(self.spilling)
+        return WordCountsSnapshot(self, dict(self.counts), runs, spilling)
+
+    def _release(self):
+        with self.lock:
+            self.readers -= 1
+            self._remove_retired()
+
+    def items(self):
+        """
+        :return: a generator of every (word, count), sorted by word if any
+            were spilled.
+        """
+        yield from self.snapshot().stream()
+
+    def read_json(self, path, batch=100000):
+        """
+        Adds the counts of a file written by WordCountsSnapshot.write_json,
+        a batch of words at a time. Files of a single line, as written
+        before, are read whole.
+        :param path: the json file.
+        :param batch: the number of words added at once.
+        :return: None
+        """
+        with open(path, "r", encoding="utf-8") as infile:
+            if infile.readline() != "{\n":
+                infile.seek(0)
+                if self.update(json.load(infile)):
+                    self.spill()
+                return
+            lines = (line.rstrip(",\n") for line in infile)
+            lines = (line for line in lines if line and line != "}")
+            while True:
+                counts = dict()
+                for line in islice(lines, batch):
+                    word, _, count = line.rpartition(": ")
+                    counts[json.loads(word)] = int(count)
+                if not counts:
+                    return
+                if self.update(counts):
+                    self.spill()
+
+
+class WordCountsSnapshot(object):
+    """
+    The counts of a WordCounter when snapshot was called.
+    """
+
+    def __init__(self, counter, counts, runs, spilling=()):
+        self.counter = counter
+        self.counts = counts
+        self.runs = runs
+        self.spilling = spilling
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.counter._release()
+
+    def items(self):
+        """
+        :return: an iterator of every (word, count), merged from the runs
+            sorted by word if any were spilled.
+        """
+        if not self.runs and not self.spilling:
+            return iter(self.counts.items())
+        return _merge_sorted(
+            [_read_run(run) for run in self.runs]
+            + [sorted(counts.items()) for counts in self.spilling]
+            + [sorted(self.counts.items())])
+
+    def stream(self):
+        """
+        :return: a generator of every (word, count) like items, which closes
+            the snapshot once read through.
+        """
+        with self:
+            yield from self.items()
+
+    def most_common(self, top=0):
+        """
+        :param top: how many words to get, 0 for all of them.
+        :return: an iterable of (word, count), most common first. The top
+            words are found with a heap over the merged counts. All of them
+            are sorted in memory if they fit, otherwise on disk in runs of
+            the counter's max_words words.
+        """
+        if top > 0:
+            return heapq.nlargest(top, self.items(), key=itemgetter(1))
+        if not self.runs and not self.spilling:
+            return sorted(self.counts.items(), key=itemgetter(1), reverse=True)
+        return self._sort_on_disk()
+
+    def _sort_on_disk(self):
+        items = self.items()
+        paths = list()
+        with tempfile.TemporaryDirectory(
+                prefix="words-sort-", dir=self.counter.directory or None) as directory:
+            while True:
+                chunk = sorted(islice(items, self.counter.max_words), key=_most_common_key)
+                if not chunk:
+                    break
+                paths.append(os.path.join(directory, f"sorted-{len(paths):06d}.tsv"))
+                _write_run(paths[-1], chunk)
+            del chunk
+            yield from heapq.merge(
+                *[_read_run(path) for path in paths], key=_most_common_key)
+
+    def write_json(self, outfile):
+        """
+        Writes the counts as a json object with one word per line, which
+        WordCounter.read_json reads back without loading the whole file.
+        :param outfile: the open text file.
+        :return: None
+        """
+        outfile.write("{\n")
+        items = self.items()
+        separator = ""
+        while True:
+            lines = [f"{encode_basestring_ascii(word)}: {count}"
+                     for word, count in islice(items, 10000)]
+            if not lines:
+                break
+            outfile.write(separator + ",\n".join(lines))
+            separator = ",\n"
+        outfile.write("\n}\n")